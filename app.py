@@ -1,6 +1,9 @@
 import streamlit as st
 
+from src.data import configure_pandas
+
 st.set_page_config(layout="wide")
+configure_pandas()
 
 st.switch_page("pages/01_Profili_cliente.py")
 
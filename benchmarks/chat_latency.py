@@ -0,0 +1,100 @@
+"""
+Latenza end-to-end (p50/p95) della chat di Vita nella pagina "Chi contattare adesso".
+
+Ogni domanda è un rerun completo della pagina con AppTest (ricerca cliente,
+contesto della conversazione, prompt, streaming della risposta) sul backend
+locale simulato: nessuna rete e nessuna API key.
+
+Uso (dalla root del repo):
+    python -m benchmarks.chat_latency [--sessions 5] [--turns 6] [--first-token-ms 300]
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from src import llm
+from src.prompts import QUICK_PROMPTS
+
+APP = Path(__file__).resolve().parents[1] / "app.py"
+PAGE = "pages/03_Chi_contattare_adesso.py"
+FOLLOW_UPS = [
+    "Come apro la conversazione?",
+    "Quali obiezioni devo aspettarmi?",
+    "Che proposta faccio se il cliente è indeciso?",
+    "Come chiudo la chiamata?",
+]
+
+
+def _timed_run(element) -> float:
+    start = time.perf_counter()
+    element.run()
+    return time.perf_counter() - start
+
+
+def _session(client: int, turns: int) -> tuple[list[float], list[float]]:
+    at = AppTest.from_file(str(APP), default_timeout=120)
+    at.switch_page(PAGE)
+    at.run()
+    at.sidebar.text_input[0].set_value("a").run()
+    select = at.sidebar.selectbox[-1]
+    select.set_value(select.options[1 + client % (len(select.options) - 1)]).run()
+
+    # Rerun senza domande: costo della pagina da solo
+    idle = [_timed_run(at) for _ in range(2)]
+
+    chat = []
+    for turn in range(turns):
+        if turn < len(QUICK_PROMPTS):
+            chat.append(_timed_run(at.button[turn].click()))
+        else:
+            question = FOLLOW_UPS[(turn - len(QUICK_PROMPTS)) % len(FOLLOW_UPS)]
+            chat.append(_timed_run(at.chat_input[0].set_value(question)))
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    return idle, chat
+
+
+def _row(label: str, values: list[float]) -> str:
+    ms = np.asarray(values) * 1000
+    return (
+        f"{label:<26} {len(ms):>5} {np.percentile(ms, 50):>9.0f} "
+        f"{np.percentile(ms, 95):>9.0f} {ms.max():>9.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    llm.set_backend(llm.MockBackend(
+        first_token_s=args.first_token_ms / 1000,
+        token_s=args.token_ms / 1000,
+        error_rate=args.error_rate,
+    ))
+
+    idle, chat = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cache vuota: si misurano le chiamate al backend, non i hit
+        llm.response_cache = llm.ResponseCache(Path(tmp) / "responses.sqlite3")
+        for client in range(args.sessions):
+            session_idle, session_chat = _session(client, args.turns)
+            idle += session_idle
+            chat += session_chat
+
+    print(f"{'':<26} {'n':>5} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}")
+    print(_row("rerun senza domanda", idle))
+    print(_row("domanda -> risposta", chat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Tempo al primo token e tempo totale delle risposte in streaming di ask_llm_stream.
+
+Uso (dalla root del repo, serve OPENROUTER_API_KEY oppure --mock):
+    python -m benchmarks.llm_stream [--repeat 5] [--url URL] [--mock]
+"""
+from __future__ import annotations
+import argparse
+import statistics
+
+from src.llm import OPENROUTER_URL, MockBackend, OpenRouterBackend, ask_llm_stream
+
+PROMPT = "Preparami in 5 righe una sintesi operativa per una chiamata con un cliente a rischio di abbandono."
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default=OPENROUTER_URL)
+    parser.add_argument("--mock", action="store_true", help="backend locale simulato")
+    args = parser.parse_args()
+    backend = MockBackend() if args.mock else OpenRouterBackend(url=args.url)
+
+    ttft, total = [], []
+    print(f"{'run':>4} {'ttft (ms)':>10} {'totale (ms)':>12} {'chunk':>6}")
+    for run in range(1, args.repeat + 1):
+        stats = {}
+        text = "".join(ask_llm_stream(PROMPT, stats=stats, cache=False, backend=backend))
+        if stats["ttft_s"] is None:
+            print(f"{run:>4} {text[:80]}")
+            continue
+        ttft.append(stats["ttft_s"])
+        total.append(stats["total_s"])
+        print(f"{run:>4} {stats['ttft_s'] * 1000:>10.0f} {stats['total_s'] * 1000:>12.0f} {stats['chunks']:>6}")
+
+    if ttft:
+        print(
+            f"{'med':>4} {statistics.median(ttft) * 1000:>10.0f} "
+            f"{statistics.median(total) * 1000:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
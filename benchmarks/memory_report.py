@@ -0,0 +1,40 @@
+"""
+Memoria occupata da ciascun dataset prima e dopo lo schema tipizzato
+(src/schema.py::DTYPES e usecols).
+
+Uso (dalla root del repo):
+    python -m benchmarks.memory_report
+"""
+from __future__ import annotations
+
+import pandas as pd
+
+from src import data
+from src.schema import REQUIRED
+
+
+def _mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+
+def main() -> None:
+    print(f"{'file':<30} {'prima (MB)':>11} {'dopo (MB)':>10} {'riduzione':>10}")
+    tot_before = tot_after = 0.0
+    for filename in REQUIRED:
+        path = data.DATA_DIR / filename
+        if not path.exists():
+            print(f"{filename:<30} {'file non trovato':>33}")
+            continue
+
+        before = _mb(pd.read_csv(path, low_memory=False))
+        after = _mb(data._read_csv_safely(path))
+        tot_before += before
+        tot_after += after
+        print(f"{filename:<30} {before:>11.2f} {after:>10.2f} {1 - after / before:>9.0%}")
+
+    if tot_before:
+        print(f"{'TOTALE':<30} {tot_before:>11.2f} {tot_after:>10.2f} {1 - tot_after / tot_before:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Tempo e memoria di picco di ogni rerun delle pagine, a diverse dimensioni dei dati.
+
+Le pagine vengono guidate con AppTest attraverso sequenze realistiche di
+widget (filtri, ricerca e selezione cliente, chat sul backend simulato, regole
+di pricing).
+Per ogni dimensione i quattro CSV vengono generati in una cartella temporanea
+con benchmarks/synthetic_data.py (stesso seed, dati coerenti). I risultati vanno
+in un file JSON; con --baseline si confrontano con un'esecuzione precedente
+e si esce con codice 1 se qualche rerun è peggiorato oltre la tolleranza.
+
+Uso (dalla root del repo):
+    python -m benchmarks.page_reruns [--sizes 10000,100000,1000000] [--output risultati.json]
+                                     [--baseline precedente.json] [--tolerance 0.25]
+"""
+from __future__ import annotations
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.synthetic_data import generate
+from src import data, llm
+
+ROOT = Path(__file__).resolve().parents[1]
+APP = ROOT / "app.py"
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# Restituito da un passo che non si applica ai dati correnti: il passo si
+# registra senza misure invece di interrompere il benchmark
+SKIP = object()
+
+
+def _widget(elements, label: str):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise KeyError(f"Widget non trovato: {label}")
+
+
+def _pick_client(at: AppTest, label: str) -> None:
+    _widget(at.sidebar.text_input, f"{label} — cerca").set_value("a").run()
+    select = _widget(at.sidebar.selectbox, label)
+    select.set_value(select.options[1])
+
+
+def _next_table_page(at: AppTest):
+    # Il selettore "Pagina" c'è solo se la tabella filtrata ha più di una pagina
+    pages = [w for w in at.number_input if w.label == "Pagina"]
+    return pages[0].set_value(2) if pages else SKIP
+
+
+# Sequenze di widget per pagina: (nome passo, azione che prepara il rerun)
+SCENARIOS = {
+    "pages/01_Profili_cliente.py": [
+        ("apertura", lambda at: at),
+        ("probabilita_alta", lambda at: _widget(at.sidebar.selectbox, "📈 Probabilità di risposta").set_value("Alta")),
+        ("area_geografica", lambda at: (s := _widget(at.sidebar.selectbox, "🏘️ Area geografica")).set_value(s.options[1])),
+        ("profilo", lambda at: (s := _widget(at.sidebar.selectbox, "🎭 Profilo cliente")).set_value(s.options[1])),
+        ("tabella_pagina_2", _next_table_page),
+        ("cliente", lambda at: _pick_client(at, "👤 Cliente")),
+    ],
+    "pages/02_Territorio.py": [
+        ("apertura", lambda at: at),
+        ("prodotto_salute", lambda at: at.sidebar.radio[0].set_value("Salute")),
+        ("mappa_dettaglio", lambda at: _widget(at.radio, "Dettaglio della mappa").set_value("Dettaglio")),
+        ("comune", lambda at: (s := _widget(at.sidebar.selectbox, "🏘️ Comune")).set_value(s.options[2])),
+        ("raggio_50_km", lambda at: _widget(at.sidebar.slider, "📏 Comuni entro (km)").set_value(50)),
+        ("tutti_i_comuni", lambda at: _widget(at.sidebar.selectbox, "🏘️ Comune").set_value("Tutte")),
+    ],
+    "pages/03_Chi_contattare_adesso.py": [
+        ("apertura", lambda at: at),
+        ("azione", lambda at: (s := _widget(at.sidebar.selectbox, "Next Best Action")).set_value(s.options[1])),
+        ("tutte_le_azioni", lambda at: _widget(at.sidebar.selectbox, "Next Best Action").set_value("Tutte")),
+        ("cliente", lambda at: _pick_client(at, "Cliente")),
+        ("chat_azione_rapida", lambda at: at.button[0].click()),
+        ("chat_domanda", lambda at: at.chat_input[0].set_value("Come apro la conversazione?")),
+    ],
+    "pages/04_Pricing.py": [
+        ("apertura", lambda at: at),
+        ("sconto_cluster", lambda at: at.slider[0].set_value(-10)),
+        ("maggiorazione_prodotto", lambda at: at.slider[-1].set_value(5)),
+        ("base_premio_ai", lambda at: _widget(at.sidebar.radio, "💶 Premio di partenza").set_value("premio_simulato")),
+        ("dettaglio_prodotto", lambda at: _widget(at.radio, "Dettaglio per").set_value("prodotto")),
+    ],
+}
+
+
+def _run_page(page: str, measure_memory: bool) -> list[dict]:
+    at = AppTest.from_file(str(APP), default_timeout=300)
+    at.switch_page(page)
+    results = []
+    for step, prepare in SCENARIOS[page]:
+        target = prepare(at) or at
+        if target is SKIP:
+            results.append({"page": page, "step": step, "wall_ms": None, "peak_mb": None})
+            continue
+        if measure_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        target.run()
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+
+        if at.exception:
+            raise RuntimeError(f"{page} / {step}: {at.exception[0].message}")
+        results.append({
+            "page": page,
+            "step": step,
+            "wall_ms": round(wall * 1000, 2),
+            "peak_mb": None if peak is None else round(peak / 2**20, 2),
+        })
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: list[dict], baseline_path: Path, tolerance: float) -> list[str]:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    previous = {(r["n_clienti"], r["page"], r["step"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["n_clienti"], r["page"], r["step"]))
+        if old is None:
+            continue
+        for metric in ("wall_ms", "peak_mb"):
+            if old[metric] and r[metric] and r[metric] > old[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{r['n_clienti']:>9,} {r['page']} / {r['step']}: "
+                    f"{metric} {old[metric]} -> {r[metric]}"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="numero di clienti, separati da virgola")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--no-memory", action="store_true", help="solo tempi, senza tracemalloc")
+    args = parser.parse_args()
+
+    # La chat usa il backend simulato senza cache: niente rete, latenza fissa
+    llm.set_backend(llm.MockBackend(first_token_s=0.05, token_s=0.002))
+    measure_memory = not args.no_memory
+    if measure_memory:
+        tracemalloc.start()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        llm.response_cache = llm.ResponseCache(Path(tmp) / "responses.sqlite3", ttl_s=0)
+        for n_clienti in (int(n) for n in args.sizes.split(",")):
+            target = Path(tmp) / str(n_clienti)
+            generate(n_clienti, target, seed=args.seed)
+            data.DATA_DIR = target
+            data.SNAPSHOT_DIR = target / ".snapshots"
+            st.cache_resource.clear()
+
+            print(f"{n_clienti:,} clienti")
+            for page in SCENARIOS:
+                for r in _run_page(page, measure_memory):
+                    r["n_clienti"] = n_clienti
+                    results.append(r)
+                    if r["wall_ms"] is None:
+                        print(f"  {Path(page).stem:<28} {r['step']:<20} {'n/a':>9}")
+                        continue
+                    peak = "" if r["peak_mb"] is None else f"{r['peak_mb']:>9.1f} MB"
+                    print(f"  {Path(page).stem:<28} {r['step']:<20} {r['wall_ms']:>9.1f} ms {peak}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "streamlit": st.__version__,
+            "tracemalloc": measure_memory,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"page_reruns-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Risultati in {output}")
+
+    if args.baseline is not None:
+        regressions = _compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSIONE", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Confronto tra lettura a freddo dei CSV e lettura dagli snapshot Parquet.
+
+Uso (dalla root del repo):
+    python -m benchmarks.snapshot_load [--repeat 5]
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import time
+
+import pandas as pd
+
+from src import data
+from src.schema import REQUIRED
+
+
+def _median_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'file':<30} {'csv (ms)':>10} {'snapshot (ms)':>14} {'speedup':>8}")
+    for filename in REQUIRED:
+        path = data.DATA_DIR / filename
+        if not path.exists():
+            print(f"{filename:<30} {'file non trovato':>34}")
+            continue
+
+        # Garantisce che lo snapshot esista prima di misurarlo
+        data._read_dataset(path)
+        snapshot = data._snapshot_path(path)
+
+        csv_med = _median_time(lambda: data._read_csv_safely(path), args.repeat)
+        snap_med = _median_time(lambda: pd.read_parquet(snapshot), args.repeat)
+
+        print(
+            f"{filename:<30} {csv_med * 1000:>10.1f} {snap_med * 1000:>14.1f} "
+            f"{csv_med / snap_med:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Generatore di dati sintetici coerenti per i quattro file di src/schema.py.
+
+Colonne e tipi di ogni file vengono da src.schema (usecols e DTYPES): se lo
+schema cambia e il generatore non lo segue, generate() fallisce invece di
+scrivere file diversi da quelli che l'app legge.
+
+Clienti, NBA e pricing condividono codice_cliente; clienti e comuni condividono
+luogo_di_residenza (n_clienti dei comuni è contato sui clienti generati e la
+zona del cliente viene dalla posizione del comune). Tutto è generato con
+operazioni vettoriali NumPy, con cardinalità e distribuzioni simili ai dati reali.
+
+Uso (dalla root del repo):
+    python -m benchmarks.synthetic_data --clienti 100000 --output data/synthetic/100k [--seed 0]
+"""
+from __future__ import annotations
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.schema import DTYPES, REQUIRED, usecols
+
+# Comuni italiani: al massimo ~7.900, come a scala nazionale (il default;
+# con n_comuni esplicito si può andare oltre)
+MAX_COMUNI = 7_900
+
+PERSONAS = ["Giovane dinamico", "Famiglia protetta", "Professionista digitale", "Senior prudente", "Risparmiatore attento"]
+RISPOSTA = ["high_responder", "moderate_responder", "low_responder", "non_responder"]
+NOMI = [
+    "marco", "luca", "giulia", "francesca", "alessandro", "sara", "anna", "paolo", "chiara", "andrea",
+    "matteo", "elena", "davide", "laura", "simone", "martina", "giorgio", "valentina", "roberto", "federica",
+]
+COGNOMI = [
+    "rossi", "russo", "ferrari", "esposito", "bianchi", "romano", "colombo", "ricci", "marino", "greco",
+    "bruno", "gallo", "conti", "de luca", "mancini", "costa", "giordano", "rizzo", "lombardi", "verdi",
+]
+# Nomi di comune unici combinando tre parti (20 x 20 x 20 = 8.000); oltre
+# si riusano le combinazioni con un numero progressivo ("montelano 2")
+PREFISSI = [
+    "", "san ", "santa ", "monte", "castel", "borgo ", "villa", "roccia", "ponte ", "torre ",
+    "colle ", "valle ", "poggio ", "piano ", "rio", "casal", "porto ", "serra", "lago ", "fonte ",
+]
+RADICI = [
+    "bell", "cort", "fior", "lun", "mar", "nov", "orv", "pal", "ros", "sal",
+    "ter", "ulm", "ver", "zan", "brig", "carr", "dom", "gall", "lev", "mont",
+]
+SUFFISSI = [
+    "ano", "ello", "ino", "ona", "ate", "ico", "iano", "ara", "ese", "eto",
+    "ola", "uzzo", "asco", "engo", "ago", "ora", "ia", "ella", "one", "ale",
+]
+
+NBA_ACTIONS = {
+    "Retention (anti-churn)": (
+        0.842,
+        "Alto rischio di abbandono su cliente di elevato valore. Contatto prioritario consigliato per prevenire la perdita.",
+    ),
+    "Engagement (riattivazione soft)": (
+        0.116,
+        "Relazione da rafforzare prima di azioni commerciali. Consigliato engagement leggero.",
+    ),
+    "Cross-sell (nuova polizza)": (
+        0.0416,
+        "Cliente con alta propensione all’acquisto e potenziale di crescita. Opportunità di cross-selling mirata.",
+    ),
+    "No action (monitoraggio)": (0.0004, "Nessuna azione immediata. Monitoraggio consigliato."),
+}
+PRODOTTI = ["assicurazione casa e famiglia: casa serena", "polizza salute e infortuni: salute protetta"]
+PRICING_ACTIONS = {
+    # azione: (frequenza, fattore sul premio)
+    "Sconto prudente (-5%)": (0.667, 0.95),
+    "Aumento premio (+15%)": (0.171, 1.15),
+    "Sconto selettivo (-10%)": (0.134, 0.90),
+    "Aumento forte / revisione coperture (+25%)": (0.0238, 1.25),
+    "Prezzo invariato": (0.0036, 1.0),
+    "Monitoraggio": (0.0005, 1.0),
+    "Aumento lieve (+5%)": (0.0003, 1.05),
+}
+PRICING_RISPOSTA = {
+    "moderate_responder": 0.603, "high_responder": 0.181, "low_responder": 0.159,
+    "non_responder": 0.051, "young_potential": 0.006,
+}
+
+
+def _choice(rng: np.random.Generator, values: dict | list, size: int, p=None) -> np.ndarray:
+    keys = list(values)
+    if isinstance(values, dict):
+        weights = np.array([v[0] if isinstance(v, tuple) else v for v in values.values()], dtype=float)
+        p = weights / weights.sum()
+    return np.asarray(keys, dtype=object)[rng.choice(len(keys), size=size, p=p)]
+
+
+def _minmax(x: np.ndarray) -> np.ndarray:
+    span = x.max() - x.min()
+    return (x - x.min()) / span if span > 0 else np.zeros_like(x)
+
+
+def _comuni(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    shape = (len(PREFISSI), len(RADICI), len(SUFFISSI))
+    combinations = int(np.prod(shape))
+    codes = rng.permutation(combinations)[:n]
+    if n > combinations:
+        codes = np.concatenate([codes, np.arange(combinations, n)])
+    p, r, s = np.unravel_index(codes % combinations, shape)
+    names = (
+        np.asarray(PREFISSI, dtype=object)[p]
+        + np.asarray(RADICI, dtype=object)[r]
+        + np.asarray(SUFFISSI, dtype=object)[s]
+    )
+    repeat = codes // combinations
+    names[repeat > 0] += np.char.mod(" %d", repeat[repeat > 0] + 1).astype(object)
+    lat = rng.uniform(36.7, 46.5, n)
+    lon = rng.uniform(7.0, 18.5, n)
+    return pd.DataFrame({"luogo_di_residenza": names, "lat": lat, "lon": lon})
+
+
+def _zona(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    zona = np.where(lat >= 44.0, "Nord", np.where(lat >= 41.5, "Centro", "Sud"))
+    sicilia = (lat < 38.3) & (lon > 12.0)
+    sardegna = (lon < 9.9) & (lat > 38.8) & (lat < 41.3)
+    isole = sicilia | sardegna
+    return np.where(isole, "Isole", zona).astype(object)
+
+
+def _clienti(rng: np.random.Generator, n: int, comuni: pd.DataFrame) -> pd.DataFrame:
+    # Pochi comuni grandi, molti piccoli: pesi di tipo Zipf su un ordine casuale
+    weights = 1.0 / np.arange(1, len(comuni) + 1) ** 0.9
+    luogo = rng.choice(len(comuni), size=n, p=rng.permutation(weights / weights.sum()))
+    cluster = rng.integers(0, len(PERSONAS), n)
+
+    return pd.DataFrame({
+        "codice_cliente": np.arange(1, n + 1, dtype=np.int64) + 10_000,
+        "nome": _choice(rng, NOMI, n),
+        "cognome": _choice(rng, COGNOMI, n),
+        "cluster": cluster,
+        "persona_label": np.asarray(PERSONAS, dtype=object)[cluster],
+        "cluster_risposta": _choice(rng, RISPOSTA, n),
+        "engagement_score": np.round(rng.beta(2.2, 1.4, n) * 100, 1),
+        "satisfaction_score": np.round(rng.beta(4.0, 1.4, n) * 100, 1),
+        "reclami_totali": np.minimum(rng.poisson(0.17, n), 4),
+        "clv_stimato": np.round(np.minimum(rng.lognormal(8.95, 0.75, n), 50_000)),
+        "potenziale_crescita": np.round(rng.beta(3.0, 2.0, n) * 95.5, 1),
+        "luogo_di_residenza": comuni["luogo_di_residenza"].to_numpy()[luogo],
+        "zona_di_residenza": _zona(comuni["lat"].to_numpy(), comuni["lon"].to_numpy())[luogo],
+        "num_polizze_totali": rng.integers(1, 5, n),
+    })
+
+
+def _nba(rng: np.random.Generator, clienti: pd.DataFrame) -> pd.DataFrame:
+    n = len(clienti)
+    action = _choice(rng, NBA_ACTIONS, n)
+    reasons = {a: reason for a, (_, reason) in NBA_ACTIONS.items()}
+    churn = np.round(rng.beta(0.6, 1.8, n), 2)
+    cross_sell = np.round(rng.beta(1.4, 0.9, n), 2)
+    clv = clienti["clv_stimato"].to_numpy()
+
+    expected = np.select(
+        [action == "Retention (anti-churn)", action == "Cross-sell (nuova polizza)", action == "Engagement (riattivazione soft)"],
+        [clv * churn, clv * cross_sell * 0.3, clv * 0.05],
+        default=0.0,
+    )
+    return pd.DataFrame({
+        "codice_cliente": clienti["codice_cliente"].to_numpy(),
+        "next_best_action": action,
+        "priority_score": expected,
+        "nba_reason": pd.Series(action).map(reasons).to_numpy(),
+        "churn_score_model": churn,
+        "cross_sell_score": cross_sell,
+        "clv_stimato": clv,
+        "potenziale_crescita": clienti["potenziale_crescita"].to_numpy(),
+        "engagement_score": clienti["engagement_score"].to_numpy(),
+        "satisfaction_score": clienti["satisfaction_score"].to_numpy(),
+        "reclami_totali": clienti["reclami_totali"].to_numpy(),
+        "mesi_da_ultima_visita": np.round(np.minimum(rng.exponential(12.5, n), 49.3), 1),
+        "multi_polizza_flag": (clienti["num_polizze_totali"].to_numpy() > 1).astype(int),
+        "valore_atteso_euro": np.round(expected),
+    })
+
+
+def _pricing(rng: np.random.Generator, clienti: pd.DataFrame) -> pd.DataFrame:
+    # ~85% dei clienti ha polizze; 1-4 righe per cliente, come nei dati reali
+    codici = clienti["codice_cliente"].to_numpy()
+    con_polizze = codici[rng.random(len(codici)) < 0.85]
+    righe = rng.choice([1, 2, 3, 4], size=len(con_polizze), p=[0.656, 0.332, 0.0117, 0.0003])
+    codice = np.repeat(con_polizze, righe)
+    n = len(codice)
+
+    actions = list(PRICING_ACTIONS)
+    freq = np.array([f for f, _ in PRICING_ACTIONS.values()])
+    action_idx = rng.choice(len(actions), size=n, p=freq / freq.sum())
+    factor = np.array([k for _, k in PRICING_ACTIONS.values()])[action_idx]
+
+    premio = np.round(np.clip(rng.normal(562, 213, n), 100, 1000))
+    simulato = np.round(premio * factor, 2)
+    p_claim = rng.beta(0.25, 2.5, n)
+    severity = rng.lognormal(8.3, 0.7, n)
+    pure = p_claim * severity
+
+    return pd.DataFrame({
+        "codice_cliente": codice,
+        "prodotto": _choice(rng, PRODOTTI, n),
+        "premio_totale_annuo": premio,
+        "premio_simulato": simulato,
+        "p_claim": p_claim,
+        "severity_pred": severity,
+        "pure_premium_pred": pure,
+        "loss_ratio_pred": pure / premio,
+        "loss_ratio_post": pure / simulato,
+        "cluster_stream1": rng.choice(5, size=n, p=[0.197, 0.017, 0.278, 0.314, 0.194]),
+        "cluster_risposta": _choice(rng, PRICING_RISPOSTA, n),
+        "pricing_action": np.asarray(actions, dtype=object)[action_idx],
+    })
+
+
+def _potential(rng: np.random.Generator, comuni: pd.DataFrame, clienti: pd.DataFrame) -> pd.DataFrame:
+    n = len(comuni)
+    codes = pd.Categorical(clienti["luogo_di_residenza"], categories=comuni["luogo_di_residenza"]).codes
+    n_clienti = np.bincount(codes, minlength=n)
+
+    polizze_casa = rng.binomial(n_clienti, 0.5)
+    polizze_salute = rng.binomial(n_clienti, 0.47)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pen_casa = np.where(n_clienti > 0, polizze_casa / n_clienti, 0.0)
+        pen_salute = np.where(n_clienti > 0, polizze_salute / n_clienti, 0.0)
+
+    ndvi = np.round(rng.beta(1.2, 3.0, n), 6)
+    valore = rng.normal(275_000, 110_000, n).clip(60_000, 775_000)
+    gap_casa = 1 - pen_casa
+    gap_salute = 1 - pen_salute
+    aff = _minmax(valore)
+    ndvi_norm = _minmax(ndvi)
+    pg_casa = _minmax(gap_casa)
+    pg_salute = _minmax(gap_salute)
+
+    return pd.DataFrame({
+        "luogo_di_residenza": comuni["luogo_di_residenza"].to_numpy(),
+        "n_clienti": n_clienti,
+        "lat": comuni["lat"].to_numpy(),
+        "lon": comuni["lon"].to_numpy(),
+        "penetrazione_casa": pen_casa,
+        "penetrazione_salute": pen_salute,
+        "NDVI_mean": ndvi,
+        "protection_gap_casa": gap_casa,
+        "protection_gap_salute": gap_salute,
+        "valore_immobiliare_medio": valore,
+        "potential_score_casa": pg_casa * (0.6 * aff + 0.4 * ndvi_norm) * (n_clienti > 0),
+        "potential_score_salute": pg_salute * (0.6 * aff + 0.4 * (1 - ndvi_norm)) * (n_clienti > 0),
+    })
+
+
+def _conform(filename: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Colonne nell'ordine e con i tipi dello schema. Una colonna obbligatoria
+    # mancante o una colonna che lo schema non conosce è un errore del generatore;
+    # il cast ai DTYPES fallisce se un valore non sta nel tipo dichiarato
+    columns = usecols(filename)
+    missing = [c for c in REQUIRED[filename] if c not in df.columns]
+    unknown = [c for c in df.columns if c not in columns]
+    if missing:
+        raise ValueError(f"[{filename}] Il generatore non produce le colonne: {missing}")
+    if unknown:
+        raise ValueError(f"[{filename}] Colonne assenti da src/schema.py: {unknown}")
+    df = df[[c for c in columns if c in df.columns]]
+    return df.astype({c: t for c, t in DTYPES[filename].items() if c in df.columns})
+
+
+def _write_csv(df: pd.DataFrame, path: Path) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        df.to_csv(path, index=False)
+        return
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def generate(n_clienti: int, target: Path, seed: int = 0, n_comuni: int | None = None) -> dict[str, int]:
+    """
+    Scrive in `target` i quattro CSV di REQUIRED per `n_clienti` clienti.
+    Restituisce il numero di righe per file.
+    """
+    rng = np.random.default_rng(seed)
+    n_comuni = n_comuni or min(MAX_COMUNI, max(100, n_clienti // 2))
+
+    comuni = _comuni(rng, n_comuni)
+    clienti = _clienti(rng, n_clienti, comuni)
+    frames = {
+        "clienti_clusterizzati.csv": clienti,
+        "potential_score_comuni.csv": _potential(rng, comuni, clienti),
+        "nba_scores_clienti.csv": _nba(rng, clienti),
+        "pricing_ai_output.csv": _pricing(rng, clienti),
+    }
+
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    for filename in REQUIRED:
+        _write_csv(_conform(filename, frames[filename]), target / filename)
+    return {filename: len(df) for filename, df in frames.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clienti", type=int, default=100_000)
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--comuni", type=int, default=None)
+    args = parser.parse_args()
+    if args.clienti < 1:
+        parser.error("--clienti deve essere almeno 1")
+    if args.comuni is not None and args.comuni < 1:
+        parser.error("--comuni deve essere almeno 1")
+
+    start = time.perf_counter()
+    rows = generate(args.clienti, args.output, seed=args.seed, n_comuni=args.comuni)
+    elapsed = time.perf_counter() - start
+
+    for filename, n in rows.items():
+        print(f"{filename:<30} {n:>12,} righe")
+    print(f"Scritti in {args.output} in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
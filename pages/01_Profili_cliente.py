@@ -2,12 +2,19 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
-from src.data import get_df
+from src import timing
+from src.charts import cached_chart
+from src.data import client_positions, configure_pandas, get_df, get_options
+from src.cube import AggregateCube, get_cube
+from src.filters import get_filter_index
+from src.search import client_search_box
+from src.table import paged_table
 
 st.set_page_config(
     page_title="Profili cliente",
     layout="wide"
 )
+configure_pandas()
 
 # ---- GLOBAL CSS ----
 st.markdown(
@@ -40,17 +47,22 @@ st.sidebar.page_link("app.py", label="Home")
 st.sidebar.page_link("pages/01_Profili_cliente.py", label="Profili cliente")
 st.sidebar.page_link("pages/02_Territorio.py", label="Territorio")
 st.sidebar.page_link("pages/03_Chi_contattare_adesso.py", label="Chi contattare adesso")
+st.sidebar.page_link("pages/04_Pricing.py", label="Pricing")
 
 st.sidebar.markdown("---")
 
 st.title("CONOSCIAMO IL CLIENTE")
 st.caption("Qui trovi una lettura chiara dei tuoi clienti: chi sono, che valore hanno per Vita Sicura e come si comportano nel tempo. Usa questi profili per adattare il tuo approccio, capire su chi investire più tempo e costruire una relazione coerente con i bisogni reali dei tuoi clienti.")
 
+timing.begin("01_Profili_cliente")
+
 # -------------------------------------------------
 # LOAD DATA
 # -------------------------------------------------
 df = get_df("clienti_clusterizzati.csv")
 
+timing.lap("caricamento")
+
 # -------------------------------------------------
 # BUSINESS LABELS (presentation layer)
 # -------------------------------------------------
@@ -77,36 +89,16 @@ def rename_for_display(df: pd.DataFrame) -> pd.DataFrame:
 # SIDEBAR FILTERS — consulente-first
 # -------------------------------------------------
 
-# 0) Crea subito la colonna (così df_ctx la eredita sempre)
-cluster_resp_map = {
-    "high_responder": "Alta",
-    "moderate_responder": "Media",
-    "low_responder": "Bassa"
-}
-df["probabilita_risposta"] = df["cluster_risposta"].map(cluster_resp_map)
-
-# 1) Cliente (focus singolo vs vista aggregata)
-df["cliente_label"] = (
-    df["nome"].fillna("").astype(str).str.title() + " " +
-    df["cognome"].fillna("").astype(str).str.title() +
-    " — ID " + df["codice_cliente"].astype(str)
-)
-
-cliente_options = ["Tutti"] + sorted(df["cliente_label"].unique().tolist())
+# probabilita_risposta e cliente_label sono colonne derivate calcolate in src.data
 
-cliente_sel = st.sidebar.selectbox(
-    "👤 Cliente",
-    options=cliente_options,
-    index=0
-)
+# 1) Cliente (focus singolo vs vista aggregata): ricerca indicizzata,
+#    al browser arrivano solo i primi risultati
+cliente_id = client_search_box("clienti_clusterizzati.csv", "👤 Cliente")
 
-if cliente_sel == "Tutti":
-    df_ctx = df.copy()
+if cliente_id is None:
     cliente_row = None
 else:
-    cliente_id = int(cliente_sel.split("ID ")[-1])
-    df_ctx = df[df["codice_cliente"] == cliente_id].copy()
-    cliente_row = df_ctx.iloc[0]
+    cliente_row = df.iloc[client_positions("clienti_clusterizzati.csv", cliente_id)[0]]
 
 st.sidebar.markdown("")
 
@@ -118,30 +110,20 @@ cluster_resp_sel = st.sidebar.selectbox(
     options=cluster_resp_options
 )
 
-if cluster_resp_sel == "Tutte":
-    cluster_resp_sel = df["probabilita_risposta"].dropna().unique().tolist()
-else:
-    cluster_resp_sel = [cluster_resp_sel]
-
 st.sidebar.markdown("")
 
 # 3) Area geografica
-zona_options = ["Tutte"] + sorted(df["zona_di_residenza"].dropna().unique())
+zona_options = ["Tutte"] + get_options("clienti_clusterizzati.csv", "zona_di_residenza")
 
 zona_sel = st.sidebar.selectbox(
     "🏘️ Area geografica",
     options=zona_options
 )
 
-if zona_sel == "Tutte":
-    zona_sel = df["zona_di_residenza"].dropna().unique().tolist()
-else:
-    zona_sel = [zona_sel]
-
 st.sidebar.markdown("")
 
 # 4) Profilo cliente (Persona)
-persona_options = ["Tutti"] + sorted(df["persona_label"].dropna().unique())
+persona_options = ["Tutti"] + get_options("clienti_clusterizzati.csv", "persona_label")
 
 persona_sel = st.sidebar.selectbox(
     "🎭 Profilo cliente",
@@ -149,32 +131,72 @@ persona_sel = st.sidebar.selectbox(
     index=0
 )
 
-if persona_sel == "Tutti":
-    persona_sel = df["persona_label"].dropna().unique().tolist()
+# -------------------------------------------------
+# APPLY FILTERS (cumulativi, indice bitmap: "Tutte"/"Tutti" non filtra)
+# -------------------------------------------------
+filter_index = get_filter_index(
+    "clienti_clusterizzati.csv",
+    ["persona_label", "probabilita_risposta", "zona_di_residenza"]
+)
+
+selection = dict(
+    persona_label=None if persona_sel == "Tutti" else persona_sel,
+    probabilita_risposta=None if cluster_resp_sel == "Tutte" else cluster_resp_sel,
+    zona_di_residenza=None if zona_sel == "Tutte" else zona_sel,
+)
+
+mask = filter_index.mask(**selection)
+
+if cliente_id is not None:
+    positions = client_positions("clienti_clusterizzati.csv", cliente_id)
+    if mask is not None:
+        positions = positions[mask[positions]]
+    df_ctx = df.iloc[positions]
 else:
-    persona_sel = [persona_sel]
+    df_ctx = df if mask is None else df[mask]
+
+timing.lap("filtri")
 
 # -------------------------------------------------
-# APPLY FILTERS (cumulativi)
+# AGGREGATI (cubo precalcolato: KPI, grafici e profilo medio
+# si ottengono sommando celle, senza groupby sui clienti)
 # -------------------------------------------------
-df_ctx = df_ctx[
-    df_ctx["persona_label"].isin(persona_sel)
-    & df_ctx["probabilita_risposta"].isin(cluster_resp_sel)
-    & df_ctx["zona_di_residenza"].isin(zona_sel)
+cube_dimensions = ["persona_label", "probabilita_risposta", "zona_di_residenza"]
+cube_metrics = [
+    "clv_stimato",
+    "potenziale_crescita",
+    "engagement_score",
+    "satisfaction_score",
+    "reclami_totali",
+    "num_polizze_totali",
 ]
 
+if cliente_id is None:
+    cube = get_cube("clienti_clusterizzati.csv", cube_dimensions, cube_metrics)
+else:
+    # Singolo cliente: cubo al volo sulla riga già filtrata
+    cube = AggregateCube(df_ctx, cube_dimensions, cube_metrics)
+    selection = {}
+
+kpi = cube.aggregate(**selection)
+by_persona = cube.aggregate(by="persona_label", **selection)
+
+timing.lap("aggregati")
+
 # -------------------------------------------------
 # KPI HEADER
 # -------------------------------------------------
 c1, c2, c3, c4 = st.columns(4)
 
-c1.metric("**CLIENTI**", f"{len(df_ctx):,}")
-c2.metric("**VALORE MEDIO CLIENTE (€)**", f"{df_ctx['clv_stimato'].mean():,.0f} €")
-c3.metric("**ENGAGEMENT**", f"{df_ctx['engagement_score'].mean():.1f}")
-c4.metric("**RECLAMI MEDI**", f"{df_ctx['reclami_totali'].mean():.2f}")
+c1.metric("**CLIENTI**", f"{int(kpi['n_clienti']):,}")
+c2.metric("**VALORE MEDIO CLIENTE (€)**", f"{kpi['clv_stimato']:,.0f} €")
+c3.metric("**ENGAGEMENT**", f"{kpi['engagement_score']:.1f}")
+c4.metric("**RECLAMI MEDI**", f"{kpi['reclami_totali']:.2f}")
 
 st.markdown("---")
 
+timing.lap("kpi")
+
 # -------------------------------------------------
 # DISTRIBUZIONE PERSONAS + CLV MEDIO
 # -------------------------------------------------
@@ -183,127 +205,92 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Distribuzione clienti per persona
-persona_dist = (
-    df_ctx
-    .groupby("persona_label")
-    .size()
-    .reset_index(name="n_clienti")
-    .sort_values("n_clienti", ascending=False)
-)
-
-# CLV medio per persona
-clv_persona = (
-    df_ctx
-    .groupby("persona_label", as_index=False)
-    .agg(clv_medio=("clv_stimato", "mean"))
-)
-
-import altair as alt
-
-bar_dist = alt.Chart(persona_dist).mark_bar().encode(
-    y=alt.Y(
-        "persona_label:N",
-        title="Persona",
-        sort="-x",
-        axis=alt.Axis(labelLimit=300)
-    ),
-    x=alt.X(
-        "n_clienti:Q",
-        title="Clienti nel profilo"
-    ),
-    tooltip=["persona_label", "n_clienti"]
-).properties(height=280)
-
-bar_clv = alt.Chart(clv_persona).mark_bar().encode(
-    y=alt.Y(
-        "persona_label:N",
-        title="Persona",
-        sort="-x",
-        axis=alt.Axis(labelLimit=300)
-    ),
-    x=alt.X(
-        "clv_medio:Q",
-        title="Valore medio per cliente (€)",
-        axis=alt.Axis(format=",.0f")
-    ),
-    tooltip=[
-        "persona_label",
-        alt.Tooltip("clv_medio:Q", format=",.0f")
-    ]
-).properties(height=280)
+# I grafici dipendono solo dai filtri: spec costruiti una volta per combinazione
+chart_key = (persona_sel, cluster_resp_sel, zona_sel, cliente_id)
+
+def build_bar_dist() -> alt.Chart:
+    # Distribuzione clienti per persona
+    persona_dist = (
+        by_persona["n_clienti"]
+        .reset_index()
+        .sort_values("n_clienti", ascending=False)
+    )
+    return alt.Chart(persona_dist).mark_bar().encode(
+        y=alt.Y(
+            "persona_label:N",
+            title="Persona",
+            sort="-x",
+            axis=alt.Axis(labelLimit=300)
+        ),
+        x=alt.X(
+            "n_clienti:Q",
+            title="Clienti nel profilo"
+        ),
+        tooltip=["persona_label:N", "n_clienti:Q"]
+    ).properties(height=280)
+
+def build_bar_clv() -> alt.Chart:
+    # CLV medio per persona
+    clv_persona = (
+        by_persona["clv_stimato"]
+        .rename("clv_medio")
+        .reset_index()
+    )
+    return alt.Chart(clv_persona).mark_bar().encode(
+        y=alt.Y(
+            "persona_label:N",
+            title="Persona",
+            sort="-x",
+            axis=alt.Axis(labelLimit=300)
+        ),
+        x=alt.X(
+            "clv_medio:Q",
+            title="Valore medio per cliente (€)",
+            axis=alt.Axis(format=",.0f")
+        ),
+        tooltip=[
+            "persona_label:N",
+            alt.Tooltip("clv_medio:Q", format=",.0f")
+        ]
+    ).properties(height=280)
 
 c1, c2 = st.columns(2)
-c1.altair_chart(bar_dist, use_container_width=True)
-c2.altair_chart(bar_clv, use_container_width=True)
+cached_chart("clienti_clusterizzati.csv", "profili.persona_dist", chart_key, build_bar_dist, c1)
+cached_chart("clienti_clusterizzati.csv", "profili.persona_clv", chart_key, build_bar_clv, c2)
 
 
+timing.lap("grafici")
+
 # -------------------------------------------------
 # PROFILO MEDIO PER PERSONA
 # -------------------------------------------------
 st.subheader("Come si comportano i diversi profili di clienti")
 
-profile_cols = [
-    "clv_stimato",
-    "potenziale_crescita",
-    "engagement_score",
-    "satisfaction_score",
-    "reclami_totali",
-    "num_polizze_totali",
-]
+profile = by_persona[cube_metrics].round(2)
 
-profile = (
-    df_ctx
-    .groupby("persona_label")[profile_cols]
-    .mean()
-    .round(2)
+st.dataframe(
+    profile.rename_axis("Profilo cliente"),
+    column_config={
+        "clv_stimato": st.column_config.NumberColumn("Valore medio cliente (€)", format="€ %,.0f"),
+        "potenziale_crescita": st.column_config.NumberColumn("Potenziale di crescita", format="%.1f"),
+        "engagement_score": st.column_config.NumberColumn("Engagement (0–100)", format="%.1f"),
+        "satisfaction_score": st.column_config.NumberColumn("Soddisfazione", format="%.1f"),
+        "reclami_totali": st.column_config.NumberColumn("Reclami medi", format="%.2f"),
+        "num_polizze_totali": st.column_config.NumberColumn("N° polizze medie", format="%.1f"),
+    },
+    use_container_width=True,
 )
 
-profile_display = profile.rename(columns={
-    "clv_stimato": "Valore medio cliente (€)",
-    "potenziale_crescita": "Potenziale di crescita",
-    "engagement_score": "Engagement (0–100)",
-    "satisfaction_score": "Soddisfazione",
-    "reclami_totali": "Reclami medi",
-    "num_polizze_totali": "N° polizze medie"
-})
-
-profile_display = profile_display.rename_axis("Profilo cliente")
-
-profile_display = profile_display.style.format({
-    "Valore medio cliente (€)": "€ {:,.0f}",
-    "Potenziale di crescita": "{:.1f}",
-    "Engagement (0–100)": "{:.1f}",
-    "Soddisfazione": "{:.1f}",
-    "Reclami medi": "{:.2f}",
-    "N° polizze medie": "{:.1f}",
-})
-
-st.dataframe(profile_display, use_container_width=True)
+timing.lap("profilo_medio")
 
 # -------------------------------------------------
 # TABELLA OPERATIVA CLIENTI
 # -------------------------------------------------
 st.subheader("Clienti con maggiore potenziale")
 
-cols_show = [
-    "codice_cliente",
-    "nome",
-    "cognome",
-    "persona_label",
-    "cluster_risposta",
-    "zona_di_residenza",
-    "clv_stimato",
-    "potenziale_crescita",
-    "engagement_score",
-    "satisfaction_score",
-    "reclami_totali",
-]
-
-df_table = (
-    df_ctx[cols_show]
-    .sort_values("clv_stimato", ascending=False)
-    .rename(columns={
+paged_table(
+    df_ctx,
+    columns={
         "codice_cliente": "ID Cliente",
         "nome": "Nome",
         "cognome": "Cognome",
@@ -314,13 +301,13 @@ df_table = (
         "potenziale_crescita": "Potenziale",
         "engagement_score": "Engagement (0–100)",
         "satisfaction_score": "Soddisfazione",
-        "reclami_totali": "Reclami"
-    })
-    .reset_index(drop=True)
+        "reclami_totali": "Reclami",
+    },
+    sort_by="clv_stimato",
+    ascending=False,
+    key="clienti",
+    height=420,
 )
 
-st.dataframe(
-    df_table,
-    use_container_width=True,
-    height=420
-)
+timing.lap("tabella")
+timing.panel()
@@ -2,12 +2,18 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
-from src.data import get_df
+from src import timing
+from src.charts import cached_chart
+from src.data import configure_pandas, get_df, get_options
+from src.geo import BIN_LEVELS, get_geo_bins, within_radius
+from src.ranking import get_rank_index
+from src.table import paged_table
 
 st.set_page_config(
     page_title="🗺️ Territorio prioritario",
     layout="wide"
 )
+configure_pandas()
 
 # ---- GLOBAL CSS ----
 st.markdown(
@@ -40,6 +46,7 @@ st.sidebar.page_link("app.py", label="Home")
 st.sidebar.page_link("pages/01_Profili_cliente.py", label="Profili cliente")
 st.sidebar.page_link("pages/02_Territorio.py", label="Territorio")
 st.sidebar.page_link("pages/03_Chi_contattare_adesso.py", label="Chi contattare adesso")
+st.sidebar.page_link("pages/04_Pricing.py", label="Pricing")
 
 st.sidebar.markdown("")
 
@@ -49,11 +56,15 @@ st.caption(
     "potenziale di mercato e capacità economica per Casa e Salute."
 )
 
+timing.begin("02_Territorio")
+
 # -------------------------------------------------
 # LOAD DATA
 # -------------------------------------------------
 df = get_df("potential_score_comuni.csv")
 
+timing.lap("caricamento")
+
 # -------------------------------------------------
 # BUSINESS LABELS (presentation layer)
 # -------------------------------------------------
@@ -92,8 +103,9 @@ else:
     gap_col = "protection_gap_salute"
     score_label = "Potenziale Salute"
 
-# Filtro Comune
-zona_options = ["Tutte"] + sorted(df["luogo_di_residenza"].dropna().unique())
+# Filtro Comune (o posizione dell'agenzia) ed eventuale raggio attorno
+AGENZIA = "📍 Posizione agenzia"
+zona_options = ["Tutte", AGENZIA] + get_options("potential_score_comuni.csv", "luogo_di_residenza")
 
 zona_sel = st.sidebar.selectbox(
     "🏘️ Comune",
@@ -101,10 +113,47 @@ zona_sel = st.sidebar.selectbox(
     index=0
 )
 
+raggio_km = 0
+if zona_sel == AGENZIA:
+    agenzia_lat = st.sidebar.number_input(
+        "Latitudine agenzia", min_value=-90.0, max_value=90.0,
+        value=round(float(df["lat"].median()), 4), format="%.4f"
+    )
+    agenzia_lon = st.sidebar.number_input(
+        "Longitudine agenzia", min_value=-180.0, max_value=180.0,
+        value=round(float(df["lon"].median()), 4), format="%.4f"
+    )
+    raggio_km = st.sidebar.slider("📏 Comuni entro (km)", min_value=5, max_value=200, value=25, step=5)
+elif zona_sel != "Tutte":
+    raggio_km = st.sidebar.slider(
+        "📏 Comuni entro (km)", min_value=0, max_value=200, value=0, step=5,
+        help="0 = solo il comune selezionato"
+    )
+
 if zona_sel == "Tutte":
-    df_ctx = df.copy()
+    df_ctx = df
+elif raggio_km == 0:
+    df_ctx = df[df["luogo_di_residenza"] == zona_sel]
 else:
-    df_ctx = df[df["luogo_di_residenza"] == zona_sel].copy()
+    if zona_sel == AGENZIA:
+        centro_lat, centro_lon = agenzia_lat, agenzia_lon
+    else:
+        centro = df.loc[df["luogo_di_residenza"] == zona_sel, ["lat", "lon"]].iloc[0]
+        centro_lat, centro_lon = float(centro["lat"]), float(centro["lon"])
+    df_ctx = within_radius("potential_score_comuni.csv", centro_lat, centro_lon, raggio_km)
+
+# Posizioni di df_ctx nel frame completo (None = tutti i comuni), per le classifiche
+ctx_rows = None if zona_sel == "Tutte" else df.index.get_indexer(df_ctx.index)
+
+# Filtri da cui dipende df_ctx: entrano nella chiave degli spec dei grafici
+ctx_key = (zona_sel, raggio_km) + ((agenzia_lat, agenzia_lon) if zona_sel == AGENZIA else ())
+
+if df_ctx.empty:
+    st.info(f"Nessun comune entro {raggio_km} km dalla posizione indicata.")
+    timing.panel()
+    st.stop()
+
+timing.lap("filtri")
 
 # -------------------------------------------------
 # KPI HEADER
@@ -116,8 +165,27 @@ c2.metric("**CLIENTI**", f"{df_ctx['n_clienti'].sum():,}")
 c3.metric(f"**{score_label.upper()} MEDIO**", f"{df_ctx[score_col].mean():.2f}")
 c4.metric("**VALORE IMMOBILIARE MEDIO (€)**", f"{df_ctx['valore_immobiliare_medio'].mean():,.0f} €")
 
+if raggio_km > 0:
+    # Medie pesate sul numero di clienti di ogni comune nel raggio
+    pesi = df_ctx["n_clienti"].to_numpy(dtype="float64")
+    tot = pesi.sum()
+
+    def _media_pesata(col: str) -> float:
+        return float(pesi @ df_ctx[col].to_numpy(dtype="float64") / tot) if tot else float("nan")
+
+    centro_label = "dall'agenzia" if zona_sel == AGENZIA else f"da {zona_sel}"
+    st.caption(
+        f"Entro {raggio_km} km {centro_label}: {len(df_ctx):,} comuni, {int(tot):,} clienti · "
+        f"Potenziale Casa {_media_pesata('potential_score_casa'):.2f}, "
+        f"Salute {_media_pesata('potential_score_salute'):.2f} · "
+        f"Protection Gap Casa {_media_pesata('protection_gap_casa'):.1%}, "
+        f"Salute {_media_pesata('protection_gap_salute'):.1%} (medie pesate sui clienti)"
+    )
+
 st.markdown("---")
 
+timing.lap("kpi")
+
 # -------------------------------------------------
 # TOP COMUNI PER POTENZIALE
 # -------------------------------------------------
@@ -128,113 +196,94 @@ st.markdown(
 st.caption(
     "I comuni in alto combinano alto potenziale e bisogno assicurativo ancora scoperto."
 )
+# Classifiche precalcolate per Casa, Salute e Casa + Salute: i top-N sono
+# letture della classifica, con la soglia minima di clienti per comune
 MIN_CLIENTI = 5
-# ===== Grafico SINISTRA: focus prodotto selezionato (INVARIATO)
-top_comuni = (
-    df_ctx[df_ctx["n_clienti"] >= MIN_CLIENTI]
-    .sort_values(score_col, ascending=False)
-    .head(10)
+SCORE_MIX = ("potential_score_casa", "potential_score_salute")
+ranking = get_rank_index(
+    "potential_score_comuni.csv",
+    ("potential_score_casa", "potential_score_salute", SCORE_MIX)
 )
 
-bar_focus = alt.Chart(top_comuni).mark_bar().encode(
-    y=alt.Y(
-        "luogo_di_residenza:N",
-        sort="-x",
-        title="Comune",
-        axis=alt.Axis(labelLimit=260)
-    ),
-    x=alt.X(
-        f"{score_col}:Q",
-        title=f"{score_label} (indice sintetico)"
-    ),
-    color=alt.Color(
-        f"{gap_col}:Q",
-        scale=alt.Scale(scheme="blues"),
-        legend=None
-    ),
-    tooltip=[
-        "luogo_di_residenza",
-        alt.Tooltip(f"{score_col}:Q", format=".2f", title=score_label),
-        alt.Tooltip(f"{gap_col}:Q", format=".2f", title="Protection Gap"),
-        alt.Tooltip("valore_immobiliare_medio:Q", format=",.0f", title="Valore immobiliare"),
-        "n_clienti"
-    ]
-).properties(height=360)
-
-# ===== Grafico DESTRA: barre cumulate Casa + Salute
-
-# dati long
-df_stack = (
-    df_ctx[[
-        "luogo_di_residenza",
-        "potential_score_casa",
-        "potential_score_salute"
-    ]]
-    .melt(
-        id_vars="luogo_di_residenza",
-        var_name="Prodotto",
-        value_name="Potenziale"
+# ===== Grafico SINISTRA: focus prodotto selezionato (INVARIATO)
+def build_bar_focus() -> alt.Chart:
+    top_comuni = df.iloc[ranking.top(score_col, 10, MIN_CLIENTI, ctx_rows)]
+
+    return alt.Chart(top_comuni).mark_bar().encode(
+        y=alt.Y(
+            "luogo_di_residenza:N",
+            sort="-x",
+            title="Comune",
+            axis=alt.Axis(labelLimit=260)
+        ),
+        x=alt.X(
+            f"{score_col}:Q",
+            title=f"{score_label} (indice sintetico)"
+        ),
+        color=alt.Color(
+            f"{gap_col}:Q",
+            scale=alt.Scale(scheme="blues"),
+            legend=None
+        ),
+        tooltip=[
+            "luogo_di_residenza:N",
+            alt.Tooltip(f"{score_col}:Q", format=".2f", title=score_label),
+            alt.Tooltip(f"{gap_col}:Q", format=".2f", title="Protection Gap"),
+            alt.Tooltip("valore_immobiliare_medio:Q", format=",.0f", title="Valore immobiliare"),
+            "n_clienti:Q"
+        ]
+    ).properties(height=360)
+
+# ===== Grafico DESTRA: barre cumulate Casa + Salute (non dipende dal prodotto)
+def build_bar_stack() -> alt.Chart:
+    # top comuni per potenziale complessivo, in formato long (due barre per comune)
+    top_mix = df.iloc[ranking.top(SCORE_MIX, 10, MIN_CLIENTI, ctx_rows)]
+    df_stack = pd.concat(
+        [
+            pd.DataFrame({
+                "luogo_di_residenza": top_mix["luogo_di_residenza"].to_numpy(),
+                "Prodotto": prodotto,
+                "Potenziale": top_mix[col].to_numpy(),
+            })
+            for prodotto, col in (("Casa", "potential_score_casa"), ("Salute", "potential_score_salute"))
+        ],
+        ignore_index=True
     )
-)
 
-df_stack["Prodotto"] = df_stack["Prodotto"].map({
-    "potential_score_casa": "Casa",
-    "potential_score_salute": "Salute"
-})
-
-MIN_CLIENTI = 5
-
-df_stack = df_stack.merge(
-    df_ctx[["luogo_di_residenza", "n_clienti"]].drop_duplicates(),
-    on="luogo_di_residenza",
-    how="left"
-)
-
-df_stack = df_stack[df_stack["n_clienti"] >= MIN_CLIENTI]
-
-# top comuni per potenziale complessivo
-top_comuni_mix = (
-    df_stack
-    .groupby("luogo_di_residenza", as_index=False)["Potenziale"]
-    .sum()
-    .sort_values("Potenziale", ascending=False)
-    .head(10)["luogo_di_residenza"]
-)
-
-df_stack = df_stack[df_stack["luogo_di_residenza"].isin(top_comuni_mix)]
-
-bar_stack = alt.Chart(df_stack).mark_bar().encode(
-    y=alt.Y(
-        "luogo_di_residenza:N",
-        sort="-x",
-        title="Comune",
-        axis=alt.Axis(labelLimit=260)
-    ),
-    x=alt.X(
-        "Potenziale:Q",
-        title="Potenziale complessivo (Casa + Salute)"
-    ),
-    color=alt.Color(
-        "Prodotto:N",
-        scale=alt.Scale(range=["#4C78A8", "#72B7B2"]),
-        legend=alt.Legend(title="Prodotto")
-    ),
-    tooltip=[
-        "luogo_di_residenza",
-        "Prodotto",
-        alt.Tooltip("Potenziale:Q", format=".2f")
-    ]
-).properties(height=360)
+    return alt.Chart(df_stack).mark_bar().encode(
+        y=alt.Y(
+            "luogo_di_residenza:N",
+            sort="-x",
+            title="Comune",
+            axis=alt.Axis(labelLimit=260)
+        ),
+        x=alt.X(
+            "Potenziale:Q",
+            title="Potenziale complessivo (Casa + Salute)"
+        ),
+        color=alt.Color(
+            "Prodotto:N",
+            scale=alt.Scale(range=["#4C78A8", "#72B7B2"]),
+            legend=alt.Legend(title="Prodotto")
+        ),
+        tooltip=[
+            "luogo_di_residenza:N",
+            "Prodotto:N",
+            alt.Tooltip("Potenziale:Q", format=".2f")
+        ]
+    ).properties(height=360)
 
 # ===== Layout affiancato
 c1, c2 = st.columns(2)
 
 with c1:
-    st.altair_chart(bar_focus, use_container_width=True)
+    cached_chart("potential_score_comuni.csv", "territorio.focus", (prodotto_sel,) + ctx_key, build_bar_focus)
 
 with c2:
-    st.altair_chart(bar_stack, use_container_width=True)
+    cached_chart("potential_score_comuni.csv", "territorio.stack", ctx_key, build_bar_stack)
+
 
+timing.lap("top_comuni")
 
 # -------------------------------------------------
 # DOVE AGIRE: BISOGNO vs CAPACITÀ ECONOMICA
@@ -249,99 +298,146 @@ st.caption(
     "Le aree in basso sono da monitorare."
 )
 
-MIN_CLIENTI = 0
-# Filtriamo rumore
-df_plot = df_ctx[
-    (df_ctx[score_col] > 0.05) &
-    (df_ctx["n_clienti"] >= MIN_CLIENTI)
-].copy()
-
-scatter = alt.Chart(df_plot).mark_circle(opacity=0.7).encode(
-    x=alt.X(
-        "valore_immobiliare_medio:Q",
-        title="Valore immobiliare medio (€)",
-        axis=alt.Axis(format=",.0f")
-    ),
-    y=alt.Y(
-        f"{score_col}:Q",
-        title=score_label
-    ),
-    size=alt.Size(
-        "n_clienti:Q",
-        legend=None
-    ),
-    color=alt.Color(
-        f"{gap_col}:Q",
-        scale=alt.Scale(scheme="blues"),
-        legend=None
-    ),
-    tooltip=[
-        "luogo_di_residenza",
-        alt.Tooltip(f"{score_col}:Q", format=".2f", title=score_label),
-        alt.Tooltip(f"{gap_col}:Q", format=".2f", title="Protection Gap"),
-        alt.Tooltip("valore_immobiliare_medio:Q", format=",.0f"),
-        "n_clienti"
-    ]
-).properties(height=380)
-
-# Linee guida decisionali
-vline = alt.Chart(pd.DataFrame({"x": [300000]})).mark_rule(
-    strokeDash=[4, 4], color="gray"
-).encode(x="x:Q")
-
-hline = alt.Chart(pd.DataFrame({"y": [0.6]})).mark_rule(
-    strokeDash=[4, 4], color="gray"
-).encode(y="y:Q")
-
-# etichette dei quadranti
-labels = alt.Chart(pd.DataFrame({
-    "x": [560000, 140000, 560000, 140000],
-    "y": [0.82, 0.82, 0.22, 0.22],
-    "label": [
-        "Priorità commerciale",
-        "Bisogno alto · approccio selettivo",
-        "Valore alto · potenziale limitato",
-        "Monitoraggio"
-    ]
-})).mark_text(
-    align="center",
-    fontSize=13,
-    fontWeight="bold",
-    opacity=0.5
-).encode(
-    x="x:Q",
-    y="y:Q",
-    text="label:N"
-)
+def build_scatter() -> alt.LayerChart:
+    # Filtriamo rumore (tutti i comuni, anche con pochi clienti)
+    df_plot = df_ctx[df_ctx[score_col] > 0.05]
+
+    scatter = alt.Chart(df_plot).mark_circle(opacity=0.7).encode(
+        x=alt.X(
+            "valore_immobiliare_medio:Q",
+            title="Valore immobiliare medio (€)",
+            axis=alt.Axis(format=",.0f")
+        ),
+        y=alt.Y(
+            f"{score_col}:Q",
+            title=score_label
+        ),
+        size=alt.Size(
+            "n_clienti:Q",
+            legend=None
+        ),
+        color=alt.Color(
+            f"{gap_col}:Q",
+            scale=alt.Scale(scheme="blues"),
+            legend=None
+        ),
+        tooltip=[
+            "luogo_di_residenza:N",
+            alt.Tooltip(f"{score_col}:Q", format=".2f", title=score_label),
+            alt.Tooltip(f"{gap_col}:Q", format=".2f", title="Protection Gap"),
+            alt.Tooltip("valore_immobiliare_medio:Q", format=",.0f"),
+            "n_clienti:Q"
+        ]
+    ).properties(height=380)
+
+    # Linee guida decisionali
+    vline = alt.Chart(pd.DataFrame({"x": [300000]})).mark_rule(
+        strokeDash=[4, 4], color="gray"
+    ).encode(x="x:Q")
+
+    hline = alt.Chart(pd.DataFrame({"y": [0.6]})).mark_rule(
+        strokeDash=[4, 4], color="gray"
+    ).encode(y="y:Q")
+
+    # etichette dei quadranti
+    labels = alt.Chart(pd.DataFrame({
+        "x": [560000, 140000, 560000, 140000],
+        "y": [0.82, 0.82, 0.22, 0.22],
+        "label": [
+            "Priorità commerciale",
+            "Bisogno alto · approccio selettivo",
+            "Valore alto · potenziale limitato",
+            "Monitoraggio"
+        ]
+    })).mark_text(
+        align="center",
+        fontSize=13,
+        fontWeight="bold",
+        opacity=0.5
+    ).encode(
+        x="x:Q",
+        y="y:Q",
+        text="label:N"
+    )
+
+    return scatter + vline + hline + labels
 
 # render finale
-st.altair_chart(scatter + vline + hline + labels, use_container_width=True)
+cached_chart("potential_score_comuni.csv", "territorio.scatter", (prodotto_sel,) + ctx_key, build_scatter)
 
 
+timing.lap("scatter")
+
+# -------------------------------------------------
+# MAPPA DEL POTENZIALE (celle precalcolate)
+# -------------------------------------------------
+st.subheader(f"Mappa del {score_label}")
+st.caption(
+    "Ogni cella raggruppa i comuni di un'area: il colore è il potenziale medio "
+    "pesato sul numero di clienti. La mappa copre sempre tutto il territorio."
+)
+
+livello = st.radio(
+    "Dettaglio della mappa",
+    list(BIN_LEVELS),
+    index=1,
+    horizontal=True
+)
+
+def build_heatmap() -> alt.Chart:
+    celle = get_geo_bins(
+        "potential_score_comuni.csv",
+        ("potential_score_casa", "potential_score_salute")
+    ).cells(livello)
+
+    return alt.Chart(celle).mark_rect(stroke="white", strokeWidth=0.3).encode(
+        x=alt.X("lon_min:Q", title="Longitudine", scale=alt.Scale(zero=False)),
+        x2="lon_max:Q",
+        y=alt.Y("lat_min:Q", title="Latitudine", scale=alt.Scale(zero=False)),
+        y2="lat_max:Q",
+        color=alt.Color(
+            f"{score_col}:Q",
+            scale=alt.Scale(scheme="blues"),
+            title=score_label
+        ),
+        tooltip=[
+            alt.Tooltip(f"{score_col}:Q", format=".2f", title=score_label),
+            alt.Tooltip("n_comuni:Q", title="Comuni"),
+            alt.Tooltip("n_clienti:Q", format=",d", title="Clienti"),
+        ]
+    ).properties(height=520)
+
+cached_chart("potential_score_comuni.csv", "territorio.mappa", (prodotto_sel, livello), build_heatmap)
+
+timing.lap("mappa")
+
 # -------------------------------------------------
 # TABELLA OPERATIVA COMUNI
 # -------------------------------------------------
 st.subheader(f"Comuni prioritari ordinati per {score_label}")
 
-cols_show = [
-    "luogo_di_residenza",
-    "n_clienti",
+flag_cols = [
     "penetrazione_casa",
     "penetrazione_salute",
     "protection_gap_casa",
     "protection_gap_salute",
-    "valore_immobiliare_medio",
-    "potential_score_casa",
-    "potential_score_salute",
 ]
 
-MIN_CLIENTI = 5
-
-df_table = (
-    df_ctx[df_ctx["n_clienti"] >= MIN_CLIENTI][cols_show]
-    .sort_values(score_col, ascending=False)
-    .head(30)
-    .rename(columns={
+def _format_flags(page: pd.DataFrame) -> pd.DataFrame:
+    # 0/1 diventano No/Sì, gli altri valori percentuali; solo sulle righe della pagina
+    page = page.copy()
+    for col in flag_cols:
+        page[col] = page[col].map(
+            lambda v: "No" if v == 0 else "Sì" if v == 1 else "" if pd.isna(v) else f"{v:.1%}"
+        )
+    return page
+
+# Top 30 dalla classifica; df_ctx porta anche la distanza in modalità raggio
+top_rows = ranking.top(score_col, 30, MIN_CLIENTI, ctx_rows)
+
+paged_table(
+    df_ctx.loc[df.index[top_rows]],
+    columns={
         "luogo_di_residenza": "Comune",
         "n_clienti": "Clienti attuali",
         "penetrazione_casa": "Penetrazione Casa",
@@ -351,31 +447,19 @@ df_table = (
         "valore_immobiliare_medio": "Valore immobiliare medio (€)",
         "potential_score_casa": "Potenziale Casa",
         "potential_score_salute": "Potenziale Salute",
-    })
-    .reset_index(drop=True)
-)
-
-df_table = df_table.replace({
-    "Penetrazione Casa": {0: "No", 1: "Sì"},
-    "Penetrazione Salute": {0: "No", 1: "Sì"},
-    "Bisogno Casa non coperto": {0: "No", 1: "Sì"},
-    "Bisogno Salute non coperto": {0: "No", 1: "Sì"},
-})
-
-st.dataframe(
-    df_table.style.format({
-        "Clienti attuali": "{:,.0f}",
-        "Penetrazione Casa": "{:.1%}",
-        "Penetrazione Salute": "{:.1%}",
-        "Bisogno Casa non coperto": "{:.1%}",
-        "Bisogno Salute non coperto": "{:.1%}",
-        "Valore immobiliare medio (€)": "€ {:,.0f}",
-        "Potenziale Casa": "{:.2f}",
-        "Potenziale Salute": "{:.2f}",
-    }),
-    use_container_width=True,
-    height=420
+        **({"distanza_km": "Distanza (km)"} if raggio_km > 0 else {}),
+    },
+    formats={
+        "n_clienti": "%,d",
+        "distanza_km": "%.1f",
+        "valore_immobiliare_medio": "€ %,.0f",
+        "potential_score_casa": "%.2f",
+        "potential_score_salute": "%.2f",
+    },
+    transform=_format_flags,
+    key="comuni",
+    height=420,
 )
 
-
-
+timing.lap("tabella")
+timing.panel()
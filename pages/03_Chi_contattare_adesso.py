@@ -2,8 +2,14 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
-from src.data import get_df
-from src.llm import ask_llm
+from src import timing
+from src.charts import cached_chart
+from src.data import configure_pandas, get_client_rows, get_df, get_options
+from src.conversation import Conversation
+from src.llm import ask_llm_stream
+from src.prompts import QUICK_PROMPTS, call_prompt
+from src.search import client_search_box
+from src.table import paged_table
 
 # -------------------------------------------------
 # PAGE CONFIG
@@ -12,6 +18,7 @@ st.set_page_config(
     page_title="🎯 Chi contattare adesso",
     layout="wide"
 )
+configure_pandas()
 
 # ---- GLOBAL CSS ----
 st.markdown(
@@ -44,6 +51,7 @@ st.sidebar.page_link("app.py", label="Home")
 st.sidebar.page_link("pages/01_Profili_cliente.py", label="Profili cliente")
 st.sidebar.page_link("pages/02_Territorio.py", label="Territorio")
 st.sidebar.page_link("pages/03_Chi_contattare_adesso.py", label="Chi contattare adesso")
+st.sidebar.page_link("pages/04_Pricing.py", label="Pricing")
 
 st.sidebar.markdown("")
 
@@ -54,43 +62,36 @@ st.caption(
     "I clienti a rischio churn hanno una probabilità stimata di abbandono ≥ 70%."
 )
 
+timing.begin("03_Chi_contattare_adesso")
+
 # -------------------------------------------------
 # LOAD DATA
 # -------------------------------------------------
-df_nba = get_df("nba_scores_clienti.csv")
-df_clienti = get_df("clienti_clusterizzati.csv")
-
-df = df_nba.merge(
-    df_clienti[["codice_cliente", "nome", "cognome"]],
-    on="codice_cliente",
-    how="left"
-)
+# Vista NBA + anagrafica (cliente_label) già unita e in cache in src.data
+df = get_df("nba_clienti")
 
-df["cliente_label"] = (
-    df["nome"].fillna("").str.title() + " " +
-    df["cognome"].fillna("").str.title() +
-    " — ID " + df["codice_cliente"].astype(str)
-)
+timing.lap("caricamento")
 
 # -------------------------------------------------
 # SIDEBAR FILTERS
 # -------------------------------------------------
 st.sidebar.header("Filtri")
 
-action_options = ["Tutte"] + sorted(df["next_best_action"].unique())
+action_options = ["Tutte"] + get_options("nba_clienti", "next_best_action")
 action_sel = st.sidebar.selectbox("Next Best Action", action_options)
 
-cliente_options = ["Tutti"] + sorted(df["cliente_label"].unique())
-cliente_sel = st.sidebar.selectbox("Cliente", cliente_options)
+cliente_id = client_search_box("nba_clienti", "Cliente")
 
-df_ctx = df.copy()
+if cliente_id is not None:
+    # Lookup sull'indice per codice_cliente, senza scansionare la vista
+    df_ctx = get_client_rows("nba_clienti", cliente_id)
+else:
+    df_ctx = df
 
 if action_sel != "Tutte":
     df_ctx = df_ctx[df_ctx["next_best_action"] == action_sel]
 
-if cliente_sel != "Tutti":
-    cliente_id = int(cliente_sel.split("ID ")[-1])
-    df_ctx = df_ctx[df_ctx["codice_cliente"] == cliente_id]
+timing.lap("filtri")
 
 # -------------------------------------------------
 # KPI HEADER
@@ -106,6 +107,8 @@ c4.metric("**VALORE MEDIO CLIENTE (€)**", f"{df_ctx['clv_stimato'].mean():,.0f
 
 st.markdown("---")
 
+timing.lap("kpi")
+
 # -------------------------------------------------
 # DISTRIBUZIONE NEXT BEST ACTION
 # -------------------------------------------------
@@ -118,74 +121,69 @@ st.caption(
     "per aiutare a capire dove si concentra l’impatto delle azioni suggerite."
 )
 
-action_dist = (
-    df.groupby("next_best_action")
-    .agg(
-        n_clienti=("codice_cliente", "count"),
-        valore_totale=("valore_atteso_euro", "sum")
+# Calcolati su tutti i clienti (non sui filtri): uno spec per versione dei dati
+def action_dist() -> pd.DataFrame:
+    dist = (
+        df.groupby("next_best_action", observed=True)
+        .agg(
+            n_clienti=("codice_cliente", "count"),
+            valore_totale=("valore_atteso_euro", "sum")
+        )
+        .reset_index()
     )
-    .reset_index()
-)
-
-action_dist["valore_medio"] = (
-    action_dist["valore_totale"] / action_dist["n_clienti"]
-)
+    dist["valore_medio"] = dist["valore_totale"] / dist["n_clienti"]
+    return dist
 
-bar_vol = alt.Chart(action_dist).mark_bar().encode(
-    y=alt.Y("next_best_action:N", sort="-x", title="Azione", axis=alt.Axis(labelLimit=300)),
-    x=alt.X("n_clienti:Q", title="Numero clienti"),
-    tooltip=["next_best_action", "n_clienti"]
-).properties(height=280)
+def build_bar_vol() -> alt.Chart:
+    return alt.Chart(action_dist()).mark_bar().encode(
+        y=alt.Y("next_best_action:N", sort="-x", title="Azione", axis=alt.Axis(labelLimit=300)),
+        x=alt.X("n_clienti:Q", title="Numero clienti"),
+        tooltip=["next_best_action:N", "n_clienti:Q"]
+    ).properties(height=280)
 
 # Second bar chart for average economic value
-bar_val = alt.Chart(action_dist).mark_bar().encode(
-    y=alt.Y(
-        "next_best_action:N",
-        sort="-x",
-        title="Azione",
-        axis=alt.Axis(labelLimit=300)
-    ),
-    x=alt.X(
-        "valore_medio:Q",
-        title="Valore economico stimato (€)",
-        axis=alt.Axis(format=",.0f")
-    ),
-    tooltip=[
-        "next_best_action",
-        alt.Tooltip(
+def build_bar_val() -> alt.Chart:
+    return alt.Chart(action_dist()).mark_bar().encode(
+        y=alt.Y(
+            "next_best_action:N",
+            sort="-x",
+            title="Azione",
+            axis=alt.Axis(labelLimit=300)
+        ),
+        x=alt.X(
             "valore_medio:Q",
-            format=",.0f",
-            title="Valore economico stimato (€)"
-        )
-    ]
-).properties(height=280)
+            title="Valore economico stimato (€)",
+            axis=alt.Axis(format=",.0f")
+        ),
+        tooltip=[
+            "next_best_action:N",
+            alt.Tooltip(
+                "valore_medio:Q",
+                format=",.0f",
+                title="Valore economico stimato (€)"
+            )
+        ]
+    ).properties(height=280)
 
 c1, c2 = st.columns(2)
-c1.altair_chart(bar_vol, use_container_width=True)
-c2.altair_chart(bar_val, use_container_width=True)
+cached_chart("nba_clienti", "nba.azioni_volume", (), build_bar_vol, c1)
+cached_chart("nba_clienti", "nba.azioni_valore", (), build_bar_val, c2)
 
 st.markdown("---")
 
+timing.lap("grafici")
+
 # ------------------------------------------------- # 
 # CLIENTI PRIORITARI 
 # -------------------------------------------------
 st.subheader("Clienti su cui agire ora")
 
-cols_show = [
-    "cliente_label",
-    "next_best_action",
-    "valore_atteso_euro",
-    "churn_score_model",
-    "engagement_score",
-    "mesi_da_ultima_visita",
-    "clv_stimato",
-]
-
-df_table = (
-    df_ctx[cols_show]
-    .sort_values("valore_atteso_euro", ascending=False)
-    .head(30)
-    .rename(columns={
+def _churn_percent(page: pd.DataFrame) -> pd.DataFrame:
+    return page.assign(churn_score_model=page["churn_score_model"] * 100)
+
+paged_table(
+    df_ctx,
+    columns={
         "cliente_label": "Cliente",
         "next_best_action": "Azione consigliata",
         "valore_atteso_euro": "Valore economico stimato (€)",
@@ -193,26 +191,26 @@ df_table = (
         "engagement_score": "Engagement (0–100)",
         "mesi_da_ultima_visita": "Ultimo contatto (mesi)",
         "clv_stimato": "Valore cliente (CLV €)",
-    })
-    .reset_index(drop=True)
-)
-
-df_table["Rischio churn (%)"] = df_table["Rischio churn (%)"] * 100
-
-st.dataframe(
-    df_table.style.format({
-        "Valore economico stimato (€)": "€ {:,.0f}",
-        "Valore cliente (CLV €)": "€ {:,.0f}",
-        "Rischio churn (%)": "{:.0f} %",
-        "Engagement (0–100)": "{:.1f}",
-        "Ultimo contatto (mesi)": "{:.0f}",
-    }),
-    use_container_width=True,
-    height=380
+    },
+    formats={
+        "valore_atteso_euro": "€ %,.0f",
+        "clv_stimato": "€ %,.0f",
+        "churn_score_model": "%.0f %%",
+        "engagement_score": "%.1f",
+        "mesi_da_ultima_visita": "%.0f",
+    },
+    sort_by="valore_atteso_euro",
+    ascending=False,
+    limit=30,
+    transform=_churn_percent,
+    key="nba",
+    height=380,
 )
 
 st.markdown("---")
 
+timing.lap("tabella")
+
 # -------------------------------------------------
 # 🧠 VITA — CONSULENTE AI
 # -------------------------------------------------
@@ -229,8 +227,9 @@ st.caption(
 # -------------------------------------------------
 # STATO VUOTO
 # -------------------------------------------------
-if cliente_sel == "Tutti" or df_ctx.empty:
+if cliente_id is None or df_ctx.empty:
     st.info("Seleziona un cliente dalla tabella per attivare Vita, il tuo Consulente AI.")
+    timing.panel()
     st.stop()
 
 row = df_ctx.iloc[0]
@@ -252,8 +251,12 @@ with st.expander("📌 Riepilogo cliente (base decisionale)", expanded=False):
 # -------------------------------------------------
 # STATO CHAT
 # -------------------------------------------------
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+# Una conversazione per sessione, legata al cliente selezionato: i turni
+# precedenti vengono inviati al modello, quindi non devono mescolare clienti
+if st.session_state.get("chat_cliente") != cliente_id:
+    st.session_state.conversation = Conversation()
+    st.session_state.chat_cliente = cliente_id
+conversation = st.session_state.conversation
 
 # -------------------------------------------------
 # AZIONI GUIDATE
@@ -261,21 +264,14 @@ if "chat_history" not in st.session_state:
 st.markdown("### ⚡ Come posso aiutarti ora?")
 st.caption("Seleziona un’azione rapida oppure scrivi una domanda personalizzata.")
 
-q1, q2 = st.columns(2)
 quick_prompt = None
 
-with q1:
-    if st.button("📞 Prepara la chiamata"):
-        quick_prompt = (
-            "Preparami una sintesi operativa per la chiamata con questo cliente: "
-            "obiettivo, messaggio chiave e proposta da fare."
-        )
-with q2:
-    if st.button("⚠️ Gestire il rischio"):
-        quick_prompt = (
-            "Quali sono i principali rischi o criticità da considerare "
-            "durante la conversazione con questo cliente?"
-        )
+# Le domande rapide sono sempre le stesse: per i clienti prioritari la
+# risposta è spesso già in cache (vedi src/pregenerate.py)
+for col, (label, question) in zip(st.columns(len(QUICK_PROMPTS)), QUICK_PROMPTS.items()):
+    with col:
+        if st.button(label):
+            quick_prompt = question
 
 # -------------------------------------------------
 # INPUT LIBERO
@@ -288,51 +284,46 @@ if quick_prompt:
     user_input = quick_prompt
 
 # -------------------------------------------------
-# CHIAMATA LLM
+# RENDER CHAT
 # -------------------------------------------------
-if user_input:
-    st.session_state.chat_history.append(("user", user_input))
-
-    prompt = f"""
-Agisci come un consulente senior di una compagnia assicurativa.
-
-Il tuo obiettivo è supportare un collega nella preparazione di una chiamata con un cliente,
-utilizzando esclusivamente le informazioni fornite di seguito.
-
-PROFILO CLIENTE:
-- Azione consigliata: {row['next_best_action']}
-- Valore economico stimato: {row['valore_atteso_euro']:,.0f} €
-- Rischio di abbandono stimato: {row['churn_score_model']*100:.0f}%
-- Valore cliente (CLV): {row['clv_stimato']:,.0f} €
-- Livello di engagement: {row['engagement_score']:.1f}/100
-- Ultimo contatto: {row['mesi_da_ultima_visita']} mesi fa
-
-LINEE GUIDA:
-- Non ricalcolare né stimare nuovi dati
-- Spiegare in modo chiaro il perché dell’azione suggerita
-- Fornire indicazioni pratiche e concrete per una chiamata reale
-- Linguaggio professionale, semplice, orientato all’azione
-- Lunghezza massima: 8–10 righe
-
-DOMANDA:
-{user_input}
-"""
+if conversation.summarized:
+    st.caption(f"{conversation.summarized} messaggi precedenti riassunti per Vita")
 
-    with st.spinner("Vita sta preparando il supporto alla chiamata…"):
-        ai_response = ask_llm(prompt)
-
-    st.session_state.chat_history.append(("assistant", ai_response))
+for role, msg in conversation.turns:
+    with st.chat_message(role):
+        st.markdown(msg)
 
 # -------------------------------------------------
-# RENDER CHAT
+# CHIAMATA LLM (STREAMING)
 # -------------------------------------------------
-for role, msg in st.session_state.chat_history:
-    with st.chat_message(role):
-        st.markdown(msg)
+if user_input:
+    # Contesto dei turni precedenti, entro il budget di token
+    history = conversation.context()
+    with st.chat_message("user"):
+        st.markdown(user_input)
+
+    prompt = call_prompt(row, user_input)
+
+    # I token compaiono man mano che arrivano, invece di uno spinner fino a risposta completa
+    stats = {}
+    with st.chat_message("assistant"):
+        ai_response = st.write_stream(ask_llm_stream(prompt, stats=stats, history=history))
+        if stats["error"] is not None:
+            st.caption("Risposta non salvata nella conversazione: riprova")
+        elif stats["cached"]:
+            st.caption("Risposta già preparata (cache)")
+        elif stats["ttft_s"] is not None:
+            st.caption(f"Prima risposta in {stats['ttft_s']:.1f} s · completata in {stats['total_s']:.1f} s")
+
+    # Solo gli scambi riusciti entrano nella storia inviata al modello
+    conversation.add_exchange(user_input, ai_response, failed=stats["error"] is not None)
+
+timing.lap("chat")
+timing.panel()
 
 # -------------------------------------------------
 # RESET
 # -------------------------------------------------
 if st.button("🔄 Reset conversazione"):
-    st.session_state.chat_history = []
+    conversation.reset()
     st.rerun()
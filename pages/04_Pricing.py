@@ -0,0 +1,288 @@
+import time
+
+import streamlit as st
+import numpy as np
+import altair as alt
+
+from src import timing
+from src.charts import cached_chart
+from src.data import configure_pandas, get_df
+from src.pricing import BASES, RULE_DIMENSIONS, get_pricing_simulator
+from src.table import paged_table
+
+st.set_page_config(
+    page_title="Pricing",
+    layout="wide"
+)
+configure_pandas()
+
+# ---- GLOBAL CSS ----
+st.markdown(
+    """
+    <style>
+    /* Nasconde menu automatico */
+    [data-testid="stSidebarNav"] {
+        display: none;
+    }
+
+    /* Rimuove padding alto della sidebar */
+    section[data-testid="stSidebar"] > div:first-child {
+        padding-top: 0.1rem;
+    }
+
+    /* Rimuove margine automatico sopra il primo elemento */
+    section[data-testid="stSidebar"] img:first-of-type {
+        margin-top: 0 !important;
+        padding-top: 0 !important;
+    }
+    </style>
+    """,
+    unsafe_allow_html=True,
+)
+
+st.sidebar.image("assets/logo.png", use_container_width=True)
+st.sidebar.markdown("")
+
+st.sidebar.page_link("app.py", label="Home")
+st.sidebar.page_link("pages/01_Profili_cliente.py", label="Profili cliente")
+st.sidebar.page_link("pages/02_Territorio.py", label="Territorio")
+st.sidebar.page_link("pages/03_Chi_contattare_adesso.py", label="Chi contattare adesso")
+st.sidebar.page_link("pages/04_Pricing.py", label="Pricing")
+
+st.sidebar.markdown("---")
+
+st.title("SIMULATORE PRICING")
+st.caption(
+    "Prova sconti e maggiorazioni per probabilità di risposta, cluster e prodotto: "
+    "premi e loss ratio del portafoglio si aggiornano subito. "
+    "La simulazione non stima l'effetto del prezzo sulla permanenza dei clienti."
+)
+
+timing.begin("04_Pricing")
+
+# -------------------------------------------------
+# LOAD DATA
+# -------------------------------------------------
+df = get_df("pricing_ai_output.csv")
+
+if df.empty:
+    st.info("Nessuna polizza nel dataset di pricing.")
+    timing.panel()
+    st.stop()
+
+sim = get_pricing_simulator("pricing_ai_output.csv")
+
+timing.lap("caricamento")
+
+# -------------------------------------------------
+# BUSINESS LABELS (presentation layer)
+# -------------------------------------------------
+DIM_LABELS = {
+    "cluster_risposta": "Probabilità di risposta",
+    "cluster_stream1": "Cluster",
+    "prodotto": "Prodotto",
+}
+
+def value_label(dim: str, value) -> str:
+    return f"Cluster {value}" if dim == "cluster_stream1" else str(value)
+
+def rule_key(dim: str, value) -> str:
+    # Chiave per valore, non per posizione: se i dati cambiano le categorie,
+    # una regola resta sul suo valore invece di passare al vicino
+    return f"regola_{dim}_{value}"
+
+def reset_rules() -> None:
+    for dim in RULE_DIMENSIONS:
+        for value in sim.categories[dim]:
+            st.session_state[rule_key(dim, value)] = 0
+
+# -------------------------------------------------
+# SIDEBAR
+# -------------------------------------------------
+base = st.sidebar.radio(
+    "💶 Premio di partenza",
+    list(BASES),
+    format_func=BASES.get
+)
+
+st.sidebar.button("↺ Azzera regole", on_click=reset_rules, use_container_width=True)
+
+# -------------------------------------------------
+# REGOLE DI SCONTO / MAGGIORAZIONE
+# -------------------------------------------------
+st.subheader("Regole di sconto e maggiorazione")
+st.caption("Variazione percentuale sul premio di partenza; le regole di colonne diverse si applicano in cascata.")
+
+rules = {}
+for col, dim in zip(st.columns(len(RULE_DIMENSIONS)), RULE_DIMENSIONS):
+    col.markdown(f"**{DIM_LABELS[dim]}**")
+    changes = {}
+    for value in sim.categories[dim]:
+        # Valore iniziale in session_state (non nel widget): lo azzera anche reset_rules
+        st.session_state.setdefault(rule_key(dim, value), 0)
+        pct = col.slider(
+            value_label(dim, value),
+            min_value=-30,
+            max_value=30,
+            step=1,
+            format="%d%%",
+            key=rule_key(dim, value)
+        )
+        if pct:
+            changes[value] = pct / 100
+    rules[dim] = changes
+
+timing.lap("regole")
+
+# -------------------------------------------------
+# SIMULAZIONE
+# -------------------------------------------------
+# Premi di tutte le polizze e totali per cella: pochi millisecondi anche su
+# portafogli grandi, così gli slider rispondono subito
+sim_start = time.perf_counter()
+premi_whatif = sim.simulate(rules, base=base)
+totale = sim.summary(rules, base=base).iloc[0]
+sim_ms = (time.perf_counter() - sim_start) * 1000
+
+timing.lap("simulazione")
+
+# -------------------------------------------------
+# KPI HEADER
+# -------------------------------------------------
+c1, c2, c3, c4 = st.columns(4)
+
+delta_premi = totale["premi_simulati"] - totale["premi_attuali"]
+delta_lr = totale["loss_ratio_simulato"] - totale["loss_ratio_attuale"]
+
+c1.metric("**POLIZZE**", f"{int(totale['polizze']):,}")
+c2.metric(
+    "**PREMI SIMULATI (€)**",
+    f"{totale['premi_simulati']:,.0f} €",
+    delta=f"{delta_premi:+,.0f} € vs attuali"
+)
+c3.metric(
+    "**LOSS RATIO PORTAFOGLIO**",
+    "n.d." if np.isnan(totale["loss_ratio_simulato"]) else f"{totale['loss_ratio_simulato']:.1%}",
+    delta=None if np.isnan(delta_lr) else f"{delta_lr * 100:+.1f} pp",
+    delta_color="inverse"
+)
+c4.metric("**PREMIO MEDIO (€)**", f"{totale['premi_simulati'] / max(totale['polizze'], 1):,.0f} €")
+
+st.caption(f"Ricalcolo di {len(premi_whatif):,} polizze in {sim_ms:.1f} ms.")
+
+st.markdown("---")
+
+timing.lap("kpi")
+
+# -------------------------------------------------
+# DETTAGLIO PER DIMENSIONE
+# -------------------------------------------------
+st.subheader("Effetto delle regole per gruppo")
+
+by = st.radio(
+    "Dettaglio per",
+    RULE_DIMENSIONS,
+    format_func=DIM_LABELS.get,
+    horizontal=True
+)
+
+detail = sim.summary(rules, base=base, by=by)
+detail.index = [value_label(by, v) for v in detail.index]
+detail = detail.rename_axis(DIM_LABELS[by])
+for col in ("loss_ratio_attuale", "loss_ratio_simulato"):
+    detail[f"{col}_pct"] = detail[col] * 100
+
+# Chiave dello spec: premio di partenza, dimensione e regole attive
+rules_key = (base, by) + tuple((dim, tuple(sorted(changes.items()))) for dim, changes in rules.items())
+
+def build_lr_bars() -> alt.Chart:
+    lr = (
+        detail[["loss_ratio_attuale", "loss_ratio_simulato"]]
+        .rename(columns={"loss_ratio_attuale": "Attuale", "loss_ratio_simulato": "Simulato"})
+        .reset_index(names="gruppo")
+        .melt(id_vars="gruppo", var_name="Scenario", value_name="loss_ratio")
+    )
+    return alt.Chart(lr).mark_bar().encode(
+        y=alt.Y("gruppo:N", title=DIM_LABELS[by], axis=alt.Axis(labelLimit=300)),
+        yOffset="Scenario:N",
+        x=alt.X("loss_ratio:Q", title="Loss ratio", axis=alt.Axis(format=".0%")),
+        color=alt.Color(
+            "Scenario:N",
+            scale=alt.Scale(range=["#9DB9D5", "#4C78A8"]),
+            legend=alt.Legend(title=None, orient="top")
+        ),
+        tooltip=[
+            alt.Tooltip("gruppo:N", title=DIM_LABELS[by]),
+            "Scenario:N",
+            alt.Tooltip("loss_ratio:Q", format=".1%", title="Loss ratio")
+        ]
+    ).properties(height=300)
+
+c1, c2 = st.columns([2, 3])
+with c1:
+    cached_chart("pricing_ai_output.csv", "pricing.loss_ratio", rules_key, build_lr_bars)
+c2.dataframe(
+    detail.drop(columns=["loss_ratio_attuale", "loss_ratio_simulato"]),
+    column_config={
+        "polizze": st.column_config.NumberColumn("Polizze", format="%,d"),
+        "premi_attuali": st.column_config.NumberColumn("Premi attuali (€)", format="€ %,.0f"),
+        "premi_simulati": st.column_config.NumberColumn("Premi simulati (€)", format="€ %,.0f"),
+        "costo_atteso": st.column_config.NumberColumn("Costo sinistri atteso (€)", format="€ %,.0f"),
+        "loss_ratio_attuale_pct": st.column_config.NumberColumn("Loss ratio attuale", format="%.1f%%"),
+        "loss_ratio_simulato_pct": st.column_config.NumberColumn("Loss ratio simulato", format="%.1f%%"),
+    },
+    use_container_width=True,
+)
+
+timing.lap("dettaglio")
+
+# -------------------------------------------------
+# POLIZZE PIÙ IMPATTATE
+# -------------------------------------------------
+st.subheader("Polizze con la variazione di premio più ampia")
+
+TOP_POLIZZE = 100
+
+# Solo le righe mostrate: argpartition sulla variazione assoluta, senza
+# copiare il portafoglio in un nuovo DataFrame
+variazione = premi_whatif - sim.premiums["premio_totale_annuo"]
+
+if not np.any(variazione):
+    st.info("Nessuna variazione di premio: imposta una regola o parti dal premio proposto dall'AI.")
+else:
+    k = min(TOP_POLIZZE, len(variazione))
+    top = np.argpartition(-np.abs(variazione), k - 1)[:k]
+    top = top[np.argsort(-np.abs(variazione[top]), kind="stable")]
+    polizze = df.iloc[top].assign(premio_whatif=premi_whatif[top], variazione=variazione[top])
+    # Loss ratio della polizza dopo le regole: stesso costo atteso sul premio
+    # simulato, non definito (cella vuota) se il premio è zero
+    premio = polizze["premio_whatif"]
+    polizze["loss_ratio_whatif"] = polizze["pure_premium_pred"] / premio.where(premio > 0)
+
+    paged_table(
+        polizze,
+        columns={
+            "codice_cliente": "ID Cliente",
+            "prodotto": "Prodotto",
+            "cluster_risposta": "Probabilità di risposta",
+            "cluster_stream1": "Cluster",
+            "pricing_action": "Azione proposta dall'AI",
+            "premio_totale_annuo": "Premio attuale (€)",
+            "premio_whatif": "Premio simulato (€)",
+            "variazione": "Variazione (€)",
+            "loss_ratio_pred": "Loss ratio attuale",
+            "loss_ratio_whatif": "Loss ratio simulato",
+        },
+        formats={
+            "premio_totale_annuo": "€ %,.0f",
+            "premio_whatif": "€ %,.0f",
+            "variazione": "€ %,.0f",
+            "loss_ratio_pred": "%.2f",
+            "loss_ratio_whatif": "%.2f",
+        },
+        key="polizze",
+        height=420,
+    )
+
+timing.lap("tabella")
+timing.panel()
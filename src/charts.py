@@ -0,0 +1,81 @@
+# tool/src/charts.py
+from __future__ import annotations
+import hashlib
+from typing import Callable
+
+import altair as alt
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from .data import dataset_version
+from .timing import timed
+
+# Grafici composti: attributi che contengono altri grafici
+_CHILD_CHARTS = ("layer", "hconcat", "vconcat", "concat")
+
+def _arrow_bytes(data: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _with_named_data(chart, datasets: dict):
+    # I DataFrame del grafico (e dei sottografici) diventano dataset Arrow
+    # referenziati per nome: to_dict non passa dal trasformatore globale
+    chart = chart.copy(deep=False)
+    data = getattr(chart, "data", alt.Undefined)
+    if isinstance(data, pd.DataFrame):
+        payload = _arrow_bytes(data)
+        name = hashlib.md5(payload).hexdigest()
+        datasets[name] = payload
+        chart.data = alt.NamedData(name=name)
+    for attr in _CHILD_CHARTS:
+        children = getattr(chart, attr, alt.Undefined)
+        if isinstance(children, list):
+            setattr(chart, attr, [_with_named_data(c, datasets) for c in children])
+    spec = getattr(chart, "spec", alt.Undefined)
+    if isinstance(spec, alt.TopLevelMixin):
+        chart.spec = _with_named_data(spec, datasets)
+    return chart
+
+@timed("charts.to_spec")
+def chart_to_spec(chart: alt.TopLevelMixin) -> dict:
+    """
+    Spec Vega-Lite di un grafico Altair con i dati in Arrow nel campo
+    datasets, pronto per st.vega_lite_chart. Non tocca lo stato globale di
+    Altair (trasformatori e tema, che st.altair_chart cambia sotto un suo
+    lock): senza tema, come st.altair_chart con il tema di default. Senza il
+    DataFrame Altair non deduce i tipi: i campi vanno dichiarati (":Q", ":N").
+    """
+    datasets = {}
+    named = _with_named_data(chart, datasets)
+    # top_level=False: niente tema né $schema, i dataset restano nel contesto
+    spec = named.to_dict(format="vega-lite", context={"top_level": False, "datasets": datasets})
+    spec["$schema"] = alt.SCHEMA_URL
+    spec["datasets"] = datasets
+    return spec
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+@timed("charts.build")
+def _chart_spec(chart_id: str, version: tuple, key: tuple, _build: Callable[[], alt.TopLevelMixin]) -> dict:
+    # _build non entra nella chiave: il grafico è identificato da id, versione e filtri
+    return chart_to_spec(_build())
+
+def cached_chart(
+    dataset: str,
+    chart_id: str,
+    key: tuple,
+    build: Callable[[], alt.TopLevelMixin],
+    container=st,
+) -> None:
+    """
+    Disegna un grafico Altair costruito e serializzato una volta per
+    (versione di `dataset`, `chart_id`, `key`). `key` è la tupla dei soli
+    filtri da cui il grafico dipende; `build` prepara i dati e costruisce il
+    grafico e viene chiamata solo se lo spec non è già in cache. Un rerun
+    con gli stessi filtri (es. una domanda in chat) riusa lo spec.
+    """
+    spec = _chart_spec(chart_id, dataset_version(dataset), key, build)
+    container.vega_lite_chart(spec, use_container_width=True)
@@ -0,0 +1,102 @@
+# tool/src/conversation.py
+from __future__ import annotations
+import re
+
+# Token dei turni recenti inviati al modello, token del riassunto dei turni
+# più vecchi, turni conservati in memoria per ogni sessione
+CONTEXT_TOKEN_BUDGET = 1_200
+SUMMARY_TOKEN_BUDGET = 300
+MAX_STORED_TURNS = 20
+SNIPPET_CHARS = 160
+
+def estimate_tokens(text: str) -> int:
+    # Stima senza tokenizer: circa 4 caratteri per token
+    return len(text) // 4 + 1
+
+def _snippet(text: str) -> str:
+    # Prima frase (o primi SNIPPET_CHARS caratteri) del turno, su una riga
+    text = re.sub(r"\s+", " ", text).strip()
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= SNIPPET_CHARS else sentence[:SNIPPET_CHARS - 1] + "…"
+
+class Conversation:
+    """
+    Conversazione multi-turno con Vita, una per sessione.
+    Al modello arrivano solo i turni più recenti che stanno in `token_budget`;
+    quelli precedenti arrivano come riassunto (una riga per turno, entro
+    `summary_budget`). In memoria restano al massimo `max_turns` turni: i più
+    vecchi sopravvivono solo nel riassunto.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        summary_budget: int = SUMMARY_TOKEN_BUDGET,
+        max_turns: int = MAX_STORED_TURNS,
+    ):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_turns = max_turns
+        self.turns: list[tuple[str, str]] = []
+        self.summary_lines: list[str] = []
+        self.summarized = 0
+
+    def add(self, role: str, content: str) -> None:
+        """Aggiunge un turno ("user" o "assistant"), spostando nel riassunto quelli oltre il limite."""
+        self.turns.append((role, content))
+        excess = len(self.turns) - self.max_turns
+        if excess > 0:
+            self.summary_lines = self._summarize(self.summary_lines, self.turns[:excess])
+            self.summarized += excess
+            del self.turns[:excess]
+
+    def add_exchange(self, question: str, answer: str, failed: bool = False) -> None:
+        """
+        Aggiunge una domanda e la risposta di Vita. Uno scambio fallito (errore
+        o risposta interrotta) non entra nella conversazione: non va rimandato
+        al modello come storia né consumare il budget di token.
+        """
+        if failed:
+            return
+        self.add("user", question)
+        self.add("assistant", answer)
+
+    def _summarize(self, lines: list[str], turns: list[tuple[str, str]]) -> list[str]:
+        lines = lines + [
+            f"- {'Consulente' if role == 'user' else 'Vita'}: {_snippet(content)}" for role, content in turns
+        ]
+        # Oltre il budget si perdono le righe più vecchie
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return lines
+
+    def context(self) -> list[dict]:
+        """
+        Messaggi da inviare prima della nuova domanda: il riassunto (se c'è)
+        e la finestra dei turni più recenti entro il budget di token.
+        """
+        budget = self.token_budget
+        window = []
+        for role, content in reversed(self.turns):
+            cost = estimate_tokens(content)
+            if cost > budget:
+                break
+            window.append({"role": role, "content": content})
+            budget -= cost
+        window.reverse()
+
+        older = self.turns[:len(self.turns) - len(window)]
+        lines = self._summarize(self.summary_lines, older) if older else self.summary_lines
+        if not lines:
+            return window
+
+        summary = {
+            "role": "system",
+            "content": "Riassunto della conversazione precedente:\n" + "\n".join(lines),
+        }
+        return [summary] + window
+
+    def reset(self) -> None:
+        self.turns = []
+        self.summary_lines = []
+        self.summarized = 0
@@ -0,0 +1,107 @@
+# tool/src/cube.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+class AggregateCube:
+    """
+    Cubo di aggregati precalcolati: per ogni combinazione dei valori delle
+    dimensioni, numero di righe e, per ogni metrica, conteggio dei valori
+    presenti, somma e somma dei quadrati.
+    Qualsiasi combinazione di filtri si risponde sommando celle del cubo,
+    con un costo che non dipende dal numero di clienti.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: list[str], metrics: list[str]):
+        self.dimensions = list(dimensions)
+        self.metrics = list(metrics)
+
+        categoricals = [pd.Categorical(df[dim]) for dim in self.dimensions]
+        self.categories = {dim: c.categories for dim, c in zip(self.dimensions, categoricals)}
+        self.positions = {
+            dim: {value: i for i, value in enumerate(cats)} for dim, cats in self.categories.items()
+        }
+        shape = tuple(len(c.categories) for c in categoricals)
+
+        # Le righe senza valore in una dimensione restano fuori, come nei filtri della pagina
+        codes = np.vstack([c.codes for c in categoricals])
+        valid = (codes >= 0).all(axis=0)
+        cells = np.ravel_multi_index(tuple(codes[:, valid]), shape)
+        size = int(np.prod(shape))
+
+        self.count = np.bincount(cells, minlength=size).reshape(shape)
+        self.n = {}
+        self.sum = {}
+        self.sumsq = {}
+        for metric in self.metrics:
+            values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[valid]
+            present = ~np.isnan(values)
+            values = np.where(present, values, 0.0)
+            self.n[metric] = np.bincount(cells, weights=present, minlength=size).reshape(shape)
+            self.sum[metric] = np.bincount(cells, weights=values, minlength=size).reshape(shape)
+            self.sumsq[metric] = np.bincount(cells, weights=values * values, minlength=size).reshape(shape)
+
+    def _index(self, selected: dict) -> tuple:
+        index = []
+        for dim in self.dimensions:
+            value = selected.get(dim)
+            if value is None:
+                index.append(slice(None))
+                continue
+            pos = self.positions[dim].get(value)
+            index.append(slice(0, 0) if pos is None else slice(pos, pos + 1))
+        return tuple(index)
+
+    def aggregate(self, by: str | None = None, stat: str = "mean", **selected) -> pd.Series | pd.DataFrame:
+        """
+        Aggregati delle metriche sulle celle selezionate (dimensione=valore,
+        None = tutti i valori). `stat` è "mean", "sum" o "std".
+        Senza `by` restituisce una Series; con `by` un DataFrame con una riga
+        per ogni valore della dimensione che ha almeno un cliente.
+        """
+        unknown = set(selected) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Dimensioni non presenti nel cubo: {sorted(unknown)}")
+
+        index = self._index(selected)
+        axes = tuple(i for i, dim in enumerate(self.dimensions) if dim != by)
+
+        def total(array: np.ndarray) -> np.ndarray:
+            return array[index].sum(axis=axes)
+
+        out = {"n_clienti": total(self.count)}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for metric in self.metrics:
+                n = total(self.n[metric])
+                s = total(self.sum[metric])
+                if stat == "mean":
+                    out[metric] = s / n
+                elif stat == "sum":
+                    out[metric] = s
+                elif stat == "std":
+                    var = (total(self.sumsq[metric]) - s * s / n) / (n - 1)
+                    out[metric] = np.sqrt(np.maximum(var, 0))
+                else:
+                    raise ValueError(f"Statistica non supportata: {stat}")
+
+        if by is None:
+            return pd.Series({k: v.item() for k, v in out.items()})
+
+        values = self.categories[by][index[self.dimensions.index(by)]]
+        frame = pd.DataFrame(out, index=pd.Index(values, name=by))
+        return frame[frame["n_clienti"] > 0]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("cube.build")
+def _build_cube(
+    name: str, version: tuple, dimensions: tuple[str, ...], metrics: tuple[str, ...]
+) -> AggregateCube:
+    return AggregateCube(get_df(name), list(dimensions), list(metrics))
+
+def get_cube(name: str, dimensions: list[str], metrics: list[str]) -> AggregateCube:
+    """Cubo di aggregati di un dataset, costruito una volta per versione dei dati."""
+    return _build_cube(name, dataset_version(name), tuple(dimensions), tuple(metrics))
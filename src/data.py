@@ -1,19 +1,211 @@
 # tool/src/data.py
 from __future__ import annotations
+import codecs
+import os
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from .schema import REQUIRED
+from .schema import DTYPES, REQUIRED, usecols
+from .timing import timed
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "analytics"
 
+# Byte iniziali usati per riconoscere la codifica prima del parsing
+ENCODING_SAMPLE_BYTES = 1 << 20
+
+# Snapshot colonnari (Parquet) dei CSV: evitano di riparsare i CSV a ogni avvio.
+# Da incrementare quando cambia il modo in cui i CSV vengono letti.
+SNAPSHOT_DIR = DATA_DIR / ".snapshots"
+SNAPSHOT_VERSION = 3
+
+def configure_pandas() -> None:
+    """
+    Opzioni pandas dell'app, da chiamare all'avvio di ogni pagina.
+    Copy-on-Write (default da pandas 3): le viste date alle pagine condividono
+    i dati del dataset in cache e li copiano solo se vengono modificate.
+    """
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+def _coerce_dtypes(df: pd.DataFrame, dtypes: dict[str, str]) -> pd.DataFrame:
+    # Conversione tollerante: i valori non conformi diventano NaN
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        try:
+            df[col] = values.astype(dtype)
+        except (TypeError, ValueError):
+            df[col] = values
+    return df
+
+def _parse_typed(path: Path, encoding: str) -> pd.DataFrame:
+    wanted = set(usecols(path.name))
+    dtypes = DTYPES.get(path.name, {})
+    options = dict(
+        encoding=encoding,
+        usecols=(lambda c: c in wanted) if wanted else None,
+        low_memory=False,
+    )
+    try:
+        return pd.read_csv(path, dtype=dtypes, **options)
+    except UnicodeDecodeError:
+        raise
+    except (TypeError, ValueError):
+        # Export con valori non conformi ai tipi dichiarati (es. testo in una
+        # colonna numerica): si rilegge senza tipi e si converte colonna per colonna
+        return _coerce_dtypes(pd.read_csv(path, **options), dtypes)
+
+def _detect_encoding(path: Path) -> str:
+    with path.open("rb") as fh:
+        sample = fh.read(ENCODING_SAMPLE_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: un carattere multibyte tagliato a fine campione non è un errore
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return "latin1"
+    return "utf-8"
+
+def _fix_mojibake(value: str) -> str:
+    # "CittÃ " -> "Città": testo UTF-8 riletto come latin1/cp1252.
+    # Se il testo non torna UTF-8 valido non era mojibake e resta com'è.
+    for encoding in ("cp1252", "latin1"):
+        try:
+            return value.encode(encoding).decode("utf-8")
+        except UnicodeError:
+            continue
+    return value
+
+def _repair_mojibake(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Basta correggere le categorie, non ogni riga
+            cats = values.cat.categories
+            if not pd.api.types.is_string_dtype(cats):
+                continue
+            suspect = cats[cats.str.contains("[ÃÂâ]", regex=True)]
+            if len(suspect):
+                fixed = {c: _fix_mojibake(c) for c in suspect}
+                df[col] = values.map(lambda c: fixed.get(c, c)).astype("category")
+        elif pd.api.types.is_string_dtype(values):
+            suspect = values.str.contains("[ÃÂâ]", regex=True, na=False)
+            if suspect.any():
+                fixed = {v: _fix_mojibake(v) for v in pd.unique(values[suspect])}
+                df[col] = values.where(~suspect, values.map(fixed))
+    return df
+
 def _read_csv_safely(path: Path) -> pd.DataFrame:
-    # Prova UTF-8, poi fallback (per i file con Ã che abbiamo visto)
+    # Codifica riconosciuta da un campione iniziale: un solo parsing
+    # (per i file con Ã che abbiamo visto)
     try:
-        return pd.read_csv(path, low_memory=False)
+        df = _parse_typed(path, _detect_encoding(path))
     except UnicodeDecodeError:
-        return pd.read_csv(path, encoding="latin1", low_memory=False)
+        # Byte non UTF-8 oltre il campione: caso raro, si rilegge in latin1
+        df = _parse_typed(path, "latin1")
+
+    # Correzione del mojibake una volta sola in ingest (poi vive nello snapshot)
+    return _repair_mojibake(df)
+
+def _snapshot_path(path: Path) -> Path:
+    # mtime e dimensione del CSV nel nome: un nuovo export invalida lo snapshot
+    stat = path.stat()
+    return SNAPSHOT_DIR / f"{path.stem}-{stat.st_mtime_ns}-{stat.st_size}-v{SNAPSHOT_VERSION}.parquet"
+
+def _write_snapshot(df: pd.DataFrame, snapshot: Path, stem: str) -> None:
+    tmp = snapshot.with_name(f".{snapshot.name}.{os.getpid()}.tmp")
+    try:
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp, index=False)
+        tmp.replace(snapshot)
+    except (ImportError, OSError, TypeError, ValueError):
+        # pyarrow assente, disco in sola lettura, tipi non serializzabili:
+        # lo snapshot è solo un'ottimizzazione, si continua dal CSV
+        tmp.unlink(missing_ok=True)
+        return
+
+    # Rimuove gli snapshot obsoleti dello stesso file
+    for old in snapshot.parent.glob(f"{stem}-*.parquet"):
+        if old != snapshot:
+            old.unlink(missing_ok=True)
+
+@timed("data.read_dataset")
+def _read_dataset(path: Path) -> pd.DataFrame:
+    """
+    Legge un CSV passando dallo snapshot Parquet se è aggiornato,
+    altrimenti parsa il CSV e scrive lo snapshot per le letture successive.
+    """
+    snapshot = _snapshot_path(path)
+    if snapshot.exists():
+        try:
+            return pd.read_parquet(snapshot)
+        except (ImportError, OSError, ValueError):
+            snapshot.unlink(missing_ok=True)
+
+    df = _read_csv_safely(path)
+    _write_snapshot(df, snapshot, path.stem)
+    return df
+
+# -------------------------------------------------
+# Colonne derivate e liste di opzioni: dichiarate qui una volta,
+# calcolate una sola volta per versione del dataset
+# -------------------------------------------------
+RESPONSE_LABELS = {
+    "high_responder": "Alta",
+    "moderate_responder": "Media",
+    "low_responder": "Bassa",
+}
+
+def _title(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[col].astype(object).fillna("").astype(str).str.title()
+
+def _cliente_label(df: pd.DataFrame) -> pd.Series:
+    return (
+        _title(df, "nome") + " " +
+        _title(df, "cognome") +
+        " — ID " + df["codice_cliente"].astype(str)
+    )
+
+DERIVED = {
+    "clienti_clusterizzati.csv": {
+        "probabilita_risposta": lambda df: df["cluster_risposta"].map(RESPONSE_LABELS).astype("category"),
+        "cliente_label": _cliente_label,
+    },
+}
+
+@timed("data.join_nba_clienti")
+def _nba_clienti(nba: pd.DataFrame, clienti: pd.DataFrame) -> pd.DataFrame:
+    df = nba.merge(
+        clienti[["codice_cliente", "cliente_label"]],
+        on="codice_cliente",
+        how="left"
+    )
+    df["cliente_label"] = df["cliente_label"].fillna(" — ID " + df["codice_cliente"].astype(str))
+    return df
+
+# Viste materializzate su più file: nome -> (file sorgenti, funzione di join).
+# Sono dataset a tutti gli effetti (get_df, get_options, indici) e si
+# ricalcolano solo quando cambia uno dei file sorgenti.
+VIEWS = {
+    "nba_clienti": (["nba_scores_clienti.csv", "clienti_clusterizzati.csv"], _nba_clienti),
+}
+
+OPTIONS = {
+    "clienti_clusterizzati.csv": ["persona_label", "probabilita_risposta", "zona_di_residenza"],
+    "nba_clienti": ["next_best_action"],
+    "potential_score_comuni.csv": ["luogo_di_residenza"],
+    "nba_scores_clienti.csv": ["next_best_action"],
+    "pricing_ai_output.csv": ["prodotto", "cluster_risposta", "pricing_action"],
+}
 
 def _validate(df: pd.DataFrame, filename: str) -> None:
     required = REQUIRED.get(filename, [])
@@ -21,23 +213,114 @@ def _validate(df: pd.DataFrame, filename: str) -> None:
     if missing:
         raise ValueError(f"[{filename}] Colonne mancanti: {missing}")
 
-@st.cache_data(show_spinner=False)
-def load_all() -> dict[str, pd.DataFrame]:
-    datasets = {}
-    for filename in REQUIRED.keys():
-        path = DATA_DIR / filename
-        if not path.exists():
-            raise FileNotFoundError(f"File non trovato: {path}")
-        df = _read_csv_safely(path)
+def dataset_version(name: str) -> tuple:
+    """
+    Versione di un dataset: (mtime, dimensione) del CSV sorgente, o dei CSV
+    sorgenti per una vista. Entra nella chiave di cache, così un nuovo export
+    invalida solo i dataset che ne dipendono.
+    """
+    if name in VIEWS:
+        sources, _ = VIEWS[name]
+        return tuple(dataset_version(source) for source in sources)
+    if name not in REQUIRED:
+        raise KeyError(f"Dataset sconosciuto: {name}")
+    path = DATA_DIR / name
+    if not path.exists():
+        raise FileNotFoundError(f"File non trovato: {path}")
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+# Buffer numpy delle colonne extension: codici delle categorie, valori e
+# maschera degli interi nullable, oggetti delle stringhe python
+_EXTENSION_BUFFERS = ("_codes", "_data", "_mask", "_ndarray")
+
+def _freeze(df: pd.DataFrame) -> pd.DataFrame:
+    # Array in sola lettura: il dataset condiviso tra le sessioni non è scrivibile.
+    # Le colonne Arrow (stringhe di pandas 3) hanno già buffer immutabili.
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, np.dtype):
+            arr = values.to_numpy().view()
+            arr.flags.writeable = False
+            values = pd.Series(arr, index=df.index, name=col, copy=False)
+        else:
+            for attr in _EXTENSION_BUFFERS:
+                buf = getattr(values.array, attr, None)
+                if isinstance(buf, np.ndarray):
+                    buf.flags.writeable = False
+        columns[col] = values
+    return pd.DataFrame(columns, copy=False)
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_dataset(name: str, version: tuple) -> pd.DataFrame:
+    # Ogni dataset è letto, normalizzato e validato solo alla prima richiesta,
+    # poi resta in memoria una sola volta per processo (nessuna copia per sessione)
+    if name in VIEWS:
+        sources, join = VIEWS[name]
+        df = join(*(_load_dataset(source, v) for source, v in zip(sources, version)))
+    else:
+        df = _read_dataset(DATA_DIR / name)
 
         # Normalizzazioni leggere (sicure)
         if "codice_cliente" in df.columns:
-            df["codice_cliente"] = pd.to_numeric(df["codice_cliente"], errors="coerce").astype("Int64")
+            df["codice_cliente"] = pd.to_numeric(df["codice_cliente"], errors="coerce").astype("Int32")
 
-        _validate(df, filename)
-        datasets[filename] = df
+        _validate(df, name)
 
-    return datasets
+    for col, derive in DERIVED.get(name, {}).items():
+        df[col] = derive(df)
+
+    return _freeze(df)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _options(name: str, version: tuple, column: str) -> tuple:
+    values = _load_dataset(name, version)[column].dropna().unique()
+    return tuple(sorted(values.tolist()))
+
+def get_options(name: str, column: str) -> list:
+    """Valori distinti e ordinati di una colonna dichiarata in OPTIONS (per i filtri)."""
+    if column not in OPTIONS.get(name, []):
+        raise KeyError(f"[{name}] Nessuna lista di opzioni per la colonna: {column}")
+    return list(_options(name, dataset_version(name), column))
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _client_index(name: str, version: tuple) -> tuple[pd.Index, np.ndarray]:
+    # Codici ordinati + posizioni originali: get_loc è un lookup su hash
+    # (o una ricerca binaria se un cliente ha più righe), mai una scansione
+    codes = _load_dataset(name, version)["codice_cliente"].to_numpy(dtype="int64", na_value=-1)
+    order = np.argsort(codes, kind="stable")
+    return pd.Index(codes[order]), order
+
+def client_positions(name: str, codice_cliente: int) -> np.ndarray:
+    """Posizioni (iloc) delle righe di un cliente nel dataset."""
+    index, order = _client_index(name, dataset_version(name))
+    try:
+        loc = index.get_loc(codice_cliente)
+    except KeyError:
+        return order[:0]
+    if isinstance(loc, int):
+        loc = slice(loc, loc + 1)
+    return order[loc]
+
+def get_client_rows(name: str, codice_cliente: int) -> pd.DataFrame:
+    """Righe di un cliente, tramite l'indice su codice_cliente."""
+    return get_df(name).iloc[client_positions(name, codice_cliente)]
+
+@timed("data.get_view")
+def get_view(name: str, columns: list[str] | None = None, **extra) -> pd.DataFrame:
+    """
+    Vista di un dataset che non copia i dati base.
+    `columns` seleziona un sottoinsieme di colonne; gli argomenti extra aggiungono
+    colonne derivate (come DataFrame.assign) solo alla vista, non al dataset condiviso.
+    """
+    df = _load_dataset(name, dataset_version(name))
+    view = df[columns] if columns is not None else df.copy(deep=False)
+    return view.assign(**extra) if extra else view
 
 def get_df(name: str) -> pd.DataFrame:
-    return load_all()[name]
+    return get_view(name)
+
+def load_all() -> dict[str, pd.DataFrame]:
+    # Solo i file: le viste si chiedono per nome con get_df
+    return {name: get_df(name) for name in REQUIRED}
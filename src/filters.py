@@ -0,0 +1,59 @@
+# tool/src/filters.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    # Le maschere sono condivise tra le sessioni: nessuno deve poterle modificare
+    arr.flags.writeable = False
+    return arr
+
+class FilterIndex:
+    """
+    Indice bitmap per i filtri della sidebar: per ogni colonna categorica e ogni
+    valore, la maschera booleana delle righe che lo contengono.
+    Un filtro è l'AND delle maschere selezionate; "Tutte"/"Tutti" (None) non filtra.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: list[str]):
+        self.size = len(df)
+        self.bitmaps: dict[str, dict[object, np.ndarray]] = {}
+
+        valid = np.ones(self.size, dtype=bool)
+        for col in columns:
+            values = pd.Categorical(df[col])
+            codes = values.codes
+            valid &= codes >= 0
+            self.bitmaps[col] = {value: _readonly(codes == i) for i, value in enumerate(values.categories)}
+
+        # Come i filtri originali con "Tutte", le righe senza valore restano escluse
+        self.valid = None if valid.all() else _readonly(valid)
+
+    def mask(self, **selected) -> np.ndarray | None:
+        """
+        Maschera delle righe che soddisfano tutte le selezioni (colonna=valore).
+        Restituisce None se non serve filtrare (tutte le selezioni a None).
+        """
+        mask = self.valid
+        for col, value in selected.items():
+            bitmaps = self.bitmaps[col]
+            if value is None:
+                continue
+            bitmap = bitmaps.get(value)
+            if bitmap is None:
+                return np.zeros(self.size, dtype=bool)
+            mask = bitmap if mask is None else mask & bitmap
+        return mask
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("filters.build_index")
+def _build_index(name: str, version: tuple, columns: tuple[str, ...]) -> FilterIndex:
+    return FilterIndex(get_df(name), list(columns))
+
+def get_filter_index(name: str, columns: list[str]) -> FilterIndex:
+    """Indice bitmap di un dataset, costruito una volta per versione dei dati."""
+    return _build_index(name, dataset_version(name), tuple(columns))
@@ -0,0 +1,163 @@
+# tool/src/geo.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Distanza in km sul globo tra punti in gradi (array o scalari, con broadcasting)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class SpatialGridIndex:
+    """
+    Indice spaziale a griglia regolare in gradi: ogni punto ha l'id della sua
+    cella, e i punti sono ordinati per id. Una ricerca per raggio legge solo
+    le celle del riquadro attorno al centro (un paio di searchsorted per riga
+    di celle) e calcola la distanza esatta solo sui candidati.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_deg: float = 0.1):
+        lat = np.asarray(lat, dtype="float64")
+        lon = np.asarray(lon, dtype="float64")
+        # I punti senza coordinate restano fuori dall'indice
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        self.cell_deg = cell_deg
+        self.lat0 = float(lat[valid].min()) if len(valid) else 0.0
+        self.lon0 = float(lon[valid].min()) if len(valid) else 0.0
+        iy = self._cell(lat[valid], self.lat0)
+        ix = self._cell(lon[valid], self.lon0)
+        self.ny = int(iy.max()) + 1 if len(valid) else 0
+        self.nx = int(ix.max()) + 1 if len(valid) else 0
+
+        cells = iy * self.nx + ix
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.rows = valid[order]
+        self.lat = lat[self.rows]
+        self.lon = lon[self.rows]
+
+    def _cell(self, values, origin: float) -> np.ndarray:
+        return np.floor((values - origin) / self.cell_deg).astype("int64")
+
+    @timed("geo.within")
+    def within(self, lat: float, lon: float, radius_km: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Posizioni (nell'ordine originale dei dati) dei punti entro `radius_km`
+        dal centro, dalla più vicina, e le rispettive distanze in km.
+        """
+        if self.nx == 0 or radius_km < 0:
+            return self.rows[:0], np.empty(0)
+
+        # Riquadro che contiene il cerchio: in longitudine l'ampiezza in gradi
+        # cresce con la latitudine, si prende quella del bordo più vicino al polo
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        edge = min(abs(lat) + dlat, 89.0)
+        dlon = min(dlat / np.cos(np.radians(edge)), 180.0)
+
+        y_lo, y_hi = self._cell(np.array([lat - dlat, lat + dlat]), self.lat0)
+        x_lo, x_hi = self._cell(np.array([lon - dlon, lon + dlon]), self.lon0)
+        if y_hi < 0 or x_hi < 0 or y_lo >= self.ny or x_lo >= self.nx:
+            return self.rows[:0], np.empty(0)
+        y_lo, y_hi = max(y_lo, 0), min(y_hi, self.ny - 1)
+        x_lo, x_hi = max(x_lo, 0), min(x_hi, self.nx - 1)
+
+        # Per ogni riga di celle gli id sono contigui: un intervallo dell'array ordinato
+        first = np.arange(y_lo, y_hi + 1) * self.nx
+        starts = np.searchsorted(self.cells, first + x_lo, side="left")
+        ends = np.searchsorted(self.cells, first + x_hi, side="right")
+        candidates = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+
+        dist = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        inside = dist <= radius_km
+        candidates, dist = candidates[inside], dist[inside]
+        order = np.argsort(dist, kind="stable")
+        return self.rows[candidates[order]], dist[order]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("geo.build_index")
+def _build_index(name: str, version: tuple) -> SpatialGridIndex:
+    df = get_df(name)
+    return SpatialGridIndex(df["lat"].to_numpy(), df["lon"].to_numpy())
+
+def get_spatial_index(name: str) -> SpatialGridIndex:
+    """Indice spaziale (colonne lat/lon) di un dataset, costruito una volta per versione dei dati."""
+    return _build_index(name, dataset_version(name))
+
+def within_radius(name: str, lat: float, lon: float, radius_km: float) -> pd.DataFrame:
+    """
+    Righe del dataset entro `radius_km` dal centro, dalla più vicina, con la
+    colonna distanza_km.
+    """
+    positions, dist = get_spatial_index(name).within(lat, lon, radius_km)
+    return get_df(name).iloc[positions].assign(distanza_km=dist.astype("float32"))
+
+# Livelli della mappa: lato delle celle in gradi (le celle dei livelli si annidano)
+BIN_LEVELS = {"Ampio": 1.0, "Medio": 0.5, "Dettaglio": 0.25}
+
+class GeoBins:
+    """
+    Aggregati per cella di griglia a più risoluzioni: per ogni livello, una
+    riga per cella con almeno un punto (bordi della cella, numero di punti,
+    clienti e media delle metriche pesata sui clienti). Cambiare prodotto o
+    livello è una lettura, non una nuova aggregazione.
+    """
+
+    def __init__(self, df: pd.DataFrame, metrics: list[str], weight: str = "n_clienti", levels: dict | None = None):
+        lat = df["lat"].to_numpy(dtype="float64")
+        lon = df["lon"].to_numpy(dtype="float64")
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        weights = np.nan_to_num(df[weight].to_numpy(dtype="float64", na_value=np.nan)[valid])
+        values = {m: df[m].to_numpy(dtype="float64", na_value=np.nan)[valid] for m in metrics}
+        lat, lon = lat[valid], lon[valid]
+
+        self.levels = {}
+        for level, cell_deg in (levels or BIN_LEVELS).items():
+            # Celle allineate ai multipli del lato: i livelli restano annidati
+            iy = np.floor(lat / cell_deg).astype("int64")
+            ix = np.floor(lon / cell_deg).astype("int64")
+            cells, inverse = np.unique(np.stack([iy, ix]), axis=1, return_inverse=True)
+            inverse = inverse.ravel()
+            tot = np.bincount(inverse, weights=weights)
+
+            out = {
+                "lat_min": cells[0] * cell_deg,
+                "lat_max": (cells[0] + 1) * cell_deg,
+                "lon_min": cells[1] * cell_deg,
+                "lon_max": (cells[1] + 1) * cell_deg,
+                "n_comuni": np.bincount(inverse),
+                weight: tot.astype("int64"),
+            }
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for m, v in values.items():
+                    # Un valore mancante esce sia dal numeratore sia dal peso:
+                    # la media della cella è sui soli comuni con la metrica
+                    present = ~np.isnan(v)
+                    num = np.bincount(inverse, weights=np.where(present, v * weights, 0.0))
+                    den = np.bincount(inverse, weights=weights * present)
+                    out[m] = num / den
+            self.levels[level] = pd.DataFrame(out)
+
+    def cells(self, level: str) -> pd.DataFrame:
+        """Celle di un livello di BIN_LEVELS (frame precalcolato, da non modificare)."""
+        if level not in self.levels:
+            raise KeyError(f"Livello di aggregazione sconosciuto: {level}")
+        return self.levels[level]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("geo.build_bins")
+def _build_bins(name: str, version: tuple, metrics: tuple) -> GeoBins:
+    return GeoBins(get_df(name), list(metrics))
+
+def get_geo_bins(name: str, metrics: tuple) -> GeoBins:
+    """Celle della mappa di un dataset per tutti i livelli, calcolate una volta per versione dei dati."""
+    return _build_bins(name, dataset_version(name), metrics)
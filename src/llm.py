@@ -1,6 +1,170 @@
+from __future__ import annotations
+import hashlib
+import json
 import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Iterator
+
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .timing import timed
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+MODEL = "openai/gpt-4o-mini"
+TEMPERATURE = 0.4
+SYSTEM_PROMPT = "Sei un AI advisor per consulenti assicurativi. Spiega le decisioni in modo chiaro, operativo e professionale."
+
+# Connessione: timeout separati per apertura e lettura (la lettura include la
+# generazione), retry con backoff esponenziale e jitter solo per errori transitori.
+# La POST non è idempotente: si ritenta solo se la connessione non si è aperta
+# o se il server ha rifiutato la richiesta senza elaborarla (429, 503). Dopo
+# l'invio (timeout di lettura, connessione interrotta, 500/502/504) il server
+# potrebbe ancora generare (e fatturare) la prima risposta
+CONNECT_TIMEOUT_S = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT_S = float(os.getenv("OPENROUTER_READ_TIMEOUT", 30))
+MAX_RETRIES = 3
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 8.0
+RETRY_STATUS = frozenset({429, 503})
+POOL_SIZE = 16
+
+# Cache su disco delle risposte, condivisa da tutte le sessioni e dai riavvii
+CACHE_PATH = Path(__file__).resolve().parents[1] / "data" / ".llm_cache" / "responses.sqlite3"
+CACHE_TTL_S = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 5_000
+
+class ResponseCache:
+    """
+    Cache persistente delle risposte LLM in un file SQLite.
+    La chiave è (modello, temperatura, hash del prompt normalizzato); le voci
+    scadono dopo `ttl_s` secondi e, oltre `max_entries`, si eliminano quelle
+    usate meno di recente (LRU). Qualsiasi errore del disco vale come miss:
+    la cache è solo un'ottimizzazione.
+    """
+
+    def __init__(self, path: Path, ttl_s: float = CACHE_TTL_S, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        try:
+            self._create_schema()
+        except (OSError, sqlite3.Error):
+            pass
+
+    @staticmethod
+    def key(model: str, temperature: float, prompt: str, history: list[dict] | None = None) -> str:
+        # Spazi e a capo non cambiano la domanda: non devono cambiare la chiave.
+        # I turni precedenti sì: senza storia la chiave è quella del solo prompt
+        turns = "".join(f"{m['role']}: {m['content']}\n" for m in history or [])
+        normalized = re.sub(r"\s+", " ", f"{SYSTEM_PROMPT}\n{turns}{prompt}").strip()
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{model}|{temperature}|{digest}"
+
+    def _create_schema(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+        self._schema_ready = True
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Una connessione per operazione, sempre chiusa all'uscita
+        # (`with conn` da solo fa commit/rollback ma non la chiude).
+        # Lo schema si crea una volta sola, in __init__ o al primo uso riuscito
+        if not self._schema_ready:
+            try:
+                self._create_schema()
+            except OSError as e:
+                raise sqlite3.OperationalError(str(e)) from e
+        with closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            yield conn
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl_s:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            row = None
+        self._count(row is not None)
+        return None if row is None else row[0]
+
+    def contains(self, key: str) -> bool:
+        """Vero se la chiave ha una risposta non scaduta (senza toccare contatori e LRU)."""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT 1 FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, time.time() - self.ttl_s),
+                ).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        """Hit e miss di questo processo e numero di voci su disco."""
+        try:
+            with self._transaction() as conn:
+                entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+            "entries": entries,
+        }
+
+response_cache = ResponseCache(CACHE_PATH)
 
 def get_api_key():
     """
@@ -8,47 +172,348 @@ def get_api_key():
     1) Streamlit Secrets (Cloud / demo)
     2) Variabili d'ambiente (locale)
     """
-    return st.secrets.get("OPENROUTER_API_KEY") or os.getenv("OPENROUTER_API_KEY")
+    try:
+        secret = st.secrets.get("OPENROUTER_API_KEY")
+    except FileNotFoundError:
+        # Nessun secrets.toml (sviluppo locale): si usa solo l'ambiente
+        secret = None
+    return secret or os.getenv("OPENROUTER_API_KEY")
 
-def ask_llm(prompt: str) -> str:
-    api_key = get_api_key()
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
 
-    if not api_key:
-        return "⚠️ API key non configurata."
+def _get_session() -> requests.Session:
+    # Una sola sessione per processo: le connessioni (e l'handshake TLS)
+    # restano aperte in keep-alive e si riusano tra chiamate e sessioni
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
 
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "model": "openai/gpt-4o-mini",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "Sei un AI advisor per consulenti assicurativi. Spiega le decisioni in modo chiaro, operativo e professionale."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.4
+def _backoff_s(attempt: int, response: requests.Response | None = None) -> float:
+    # Retry-After del server se presente, altrimenti "full jitter": un tempo
+    # casuale fino a BACKOFF_BASE_S * 2^attempt, sempre entro BACKOFF_MAX_S
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_S)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
+def _never_connected(exc: requests.ConnectionError) -> bool:
+    # requests avvolge l'errore di urllib3 (MaxRetryError con `reason`): si
+    # risale la catena fino a NewConnectionError, cioè connessione mai aperta.
+    # ProtocolError/RemoteDisconnected ("Connection aborted") arrivano invece
+    # dopo l'invio e non contano
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    pending: list = [exc]
+    seen: set[int] = set()
+    while pending:
+        error = pending.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(error, NewConnectionError):
+            return True
+        pending.extend(a for a in getattr(error, "args", ()) if isinstance(a, BaseException))
+        pending.extend([getattr(error, "reason", None), error.__cause__, error.__context__])
+    return False
+
+def _post(url: str, stream: bool = False, **kwargs) -> requests.Response:
+    """
+    POST sulla sessione condivisa con retry per 429/503 e per le connessioni
+    mai aperte. Dopo MAX_RETRIES tentativi falliti restituisce l'ultima
+    risposta o rilancia l'ultima eccezione; gli errori successivi all'invio
+    (ReadTimeout, connessione interrotta) si rilanciano subito.
+    """
+    session = _get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        last = attempt == MAX_RETRIES
+        try:
+            response = session.post(
+                url, stream=stream, timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S), **kwargs
+            )
+        except requests.ConnectionError as exc:
+            # ReadTimeout non è un ConnectionError e risale senza passare di qui
+            if last or not _never_connected(exc):
+                raise
+            time.sleep(_backoff_s(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUS or last:
+            return response
+        delay = _backoff_s(attempt, response)
+        response.close()
+        time.sleep(delay)
+
+def _messages(prompt: str, history: list[dict] | None = None) -> list[dict]:
+    # `history`: turni precedenti come messaggi {"role", "content"}, tra system e domanda
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
         },
-        timeout=30
-    )
+        *(history or []),
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+class LLMError(Exception):
+    """Errore di un backend LLM; ask_llm e ask_llm_stream lo mostrano come "⚠️ ..."."""
+
+class LLMBackend(ABC):
+    """
+    Interfaccia dei backend LLM: una risposta completa (`complete`) o in
+    streaming (`stream`) per una lista di messaggi chat. Gli errori si
+    segnalano con LLMError. `model` e `temperature` entrano nella chiave di cache.
+    Un backend senza uno dei due metodi non si può istanziare.
+    """
+
+    model: str
+    temperature: float
 
-    if response.status_code != 200:
-        return f"⚠️ Errore AI: {response.text}"
+    @abstractmethod
+    def complete(self, messages: list[dict]) -> str:
+        """Risposta completa alla conversazione `messages`."""
 
-    data = response.json()
+    @abstractmethod
+    def stream(self, messages: list[dict]) -> Iterator[str]:
+        """Pezzi di testo della risposta, man mano che arrivano."""
 
-    # 🔐 protezione extra (evita crash live)
-    if "choices" not in data:
-        return f"⚠️ Risposta AI inattesa: {data}"
+class OpenRouterBackend(LLMBackend):
+    """Backend OpenRouter (API compatibile OpenAI) sulla sessione HTTP condivisa."""
 
-    return data["choices"][0]["message"]["content"]
+    def __init__(self, url: str = OPENROUTER_URL, model: str = MODEL, temperature: float = TEMPERATURE):
+        self.url = url
+        self.model = model
+        self.temperature = temperature
+
+    def _request(self, messages: list[dict], stream: bool) -> dict:
+        api_key = get_api_key()
+        if not api_key:
+            raise LLMError("API key non configurata.")
+        return dict(
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": self.model,
+                "messages": messages,
+                "temperature": self.temperature,
+                "stream": stream,
+            },
+        )
+
+    def complete(self, messages: list[dict]) -> str:
+        try:
+            response = _post(self.url, **self._request(messages, stream=False))
+        except requests.RequestException as exc:
+            raise LLMError(f"Errore di connessione AI: {exc}") from exc
+
+        if response.status_code != 200:
+            raise LLMError(f"Errore AI: {response.text}")
+
+        try:
+            data = response.json()
+        except ValueError as exc:
+            # 200 con un corpo non JSON (pagina di errore di un proxy, risposta troncata)
+            raise LLMError(f"Risposta AI non valida: {response.text[:200]}") from exc
+
+        # 🔐 protezione extra (evita crash live)
+        try:
+            return data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise LLMError(f"Risposta AI inattesa: {data}") from exc
+
+    def stream(self, messages: list[dict]) -> Iterator[str]:
+        try:
+            with _post(self.url, stream=True, **self._request(messages, stream=True)) as response:
+                if response.status_code != 200:
+                    raise LLMError(f"Errore AI: {response.text}")
+
+                # Lo stream SSE è sempre UTF-8, anche se il Content-Type non lo dichiara
+                response.encoding = "utf-8"
+                for event in _sse_events(response):
+                    if event is None:
+                        return
+                    if "error" in event:
+                        raise LLMError(f"Errore AI: {event['error']}")
+                    if "choices" not in event:
+                        continue
+                    token = event["choices"][0].get("delta", {}).get("content")
+                    if token:
+                        yield token
+        except requests.RequestException as exc:
+            raise LLMError(f"Errore di connessione AI: {exc}") from exc
+        # Connessione chiusa senza [DONE]: la risposta è troncata
+        raise LLMError("Risposta AI interrotta.")
+
+def _sse_events(response: requests.Response) -> Iterator[dict | None]:
+    # Server-Sent Events: una riga "data: {json}" per chunk, "data: [DONE]" in chiusura
+    # (segnalata con None). Le righe di commento (": OPENROUTER PROCESSING") servono
+    # solo a tenere viva la connessione.
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            yield None
+            return
+        try:
+            yield json.loads(payload)
+        except json.JSONDecodeError:
+            continue
+
+class MockBackend(LLMBackend):
+    """
+    Backend locale deterministico per test e benchmark: nessuna rete, latenza
+    simulata (attesa del primo token + ritardo per token) e una quota di
+    errori riproducibile dato il seed.
+    """
+
+    model = "mock"
+    temperature = 0.0
+
+    def __init__(
+        self,
+        first_token_s: float = 0.3,
+        token_s: float = 0.02,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        words: int = 60,
+    ):
+        self.first_token_s = first_token_s
+        self.token_s = token_s
+        self.error_rate = error_rate
+        self.words = words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _reply(self, messages: list[dict]) -> list[str]:
+        # Stessa domanda, stessa risposta: le parole dipendono solo dall'hash del prompt
+        digest = hashlib.sha256(messages[-1]["content"].encode("utf-8")).hexdigest()
+        vocabulary = ["cliente", "chiamata", "proposta", "valore", "rischio", "polizza", "contatto", "obiettivo"]
+        words = [vocabulary[int(digest[i % 64], 16) % len(vocabulary)] for i in range(self.words)]
+        return ["Risposta simulata:"] + [f" {w}" for w in words]
+
+    def _maybe_fail(self) -> None:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise LLMError("Errore AI: errore simulato (503)")
+
+    def complete(self, messages: list[dict]) -> str:
+        self._maybe_fail()
+        tokens = self._reply(messages)
+        time.sleep(self.first_token_s + self.token_s * (len(tokens) - 1))
+        return "".join(tokens)
+
+    def stream(self, messages: list[dict]) -> Iterator[str]:
+        self._maybe_fail()
+        time.sleep(self.first_token_s)
+        for i, token in enumerate(self._reply(messages)):
+            if i:
+                time.sleep(self.token_s)
+            yield token
+
+def _default_backend() -> LLMBackend:
+    # LLM_BACKEND=mock per lavorare senza rete (sviluppo, CI, load test)
+    if os.getenv("LLM_BACKEND", "openrouter") == "mock":
+        return MockBackend()
+    return OpenRouterBackend()
+
+_backend: LLMBackend = _default_backend()
+
+def get_backend() -> LLMBackend:
+    return _backend
+
+def set_backend(backend: LLMBackend) -> None:
+    """Backend usato da ask_llm e ask_llm_stream quando non se ne passa uno."""
+    global _backend
+    _backend = backend
+
+def cache_key(prompt: str, history: list[dict] | None = None, backend: LLMBackend | None = None) -> str:
+    backend = backend or _backend
+    return ResponseCache.key(backend.model, backend.temperature, prompt, history)
+
+@timed("llm.ask")
+def ask_llm(
+    prompt: str,
+    cache: bool = True,
+    history: list[dict] | None = None,
+    backend: LLMBackend | None = None,
+) -> str:
+    backend = backend or _backend
+    key = cache_key(prompt, history, backend)
+    if cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+    try:
+        content = backend.complete(_messages(prompt, history))
+    except LLMError as exc:
+        return f"⚠️ {exc}"
+
+    if cache:
+        response_cache.put(key, content)
+    return content
+
+def ask_llm_stream(
+    prompt: str,
+    stats: dict | None = None,
+    cache: bool = True,
+    history: list[dict] | None = None,
+    backend: LLMBackend | None = None,
+) -> Iterator[str]:
+    """
+    Come ask_llm, ma restituisce i token man mano che arrivano (per OpenRouter
+    la modalità `stream: true`). Gli errori arrivano come un chunk "⚠️ ...".
+    Una risposta già in cache arriva tutta in un solo chunk.
+
+    Se si passa `stats`, a fine stream contiene `ttft_s` (tempo al primo token),
+    `total_s` (tempo totale), `chunks`, `cached` ed `error` (il messaggio
+    dell'errore, None se la risposta è completa). `history` sono i turni
+    precedenti della conversazione (vedi src.conversation).
+    """
+    backend = backend or _backend
+    stats = {} if stats is None else stats
+    stats.update(ttft_s=None, total_s=None, chunks=0, cached=False, error=None)
+    start = time.perf_counter()
+    key = cache_key(prompt, history, backend)
+    tokens = []
 
+    try:
+        cached = response_cache.get(key) if cache else None
+        if cached is not None:
+            stats.update(ttft_s=time.perf_counter() - start, chunks=1, cached=True)
+            yield cached
+            return
 
+        # Comprende il tempo di chi consuma lo stream (il rendering nella pagina)
+        with timed("llm.stream"):
+            for token in backend.stream(_messages(prompt, history)):
+                if stats["ttft_s"] is None:
+                    stats["ttft_s"] = time.perf_counter() - start
+                stats["chunks"] += 1
+                tokens.append(token)
+                yield token
 
+        # Solo le risposte complete (stream chiuso senza errori) finiscono in cache
+        if cache and tokens:
+            response_cache.put(key, "".join(tokens))
+    except LLMError as exc:
+        stats["error"] = str(exc)
+        yield f"⚠️ {exc}"
+    finally:
+        stats["total_s"] = time.perf_counter() - start
@@ -0,0 +1,136 @@
+# tool/src/pregenerate.py
+"""
+Pre-generazione batch delle risposte rapide di Vita per i clienti prioritari.
+
+Le risposte finiscono nella cache di src.llm con la stessa chiave usata dalla
+pagina "Chi contattare adesso", che quindi le mostra subito. Le risposte già
+in cache si saltano: dopo un'interruzione basta rilanciare il comando.
+
+Uso (dalla root del repo, serve OPENROUTER_API_KEY):
+    python -m src.pregenerate [--top 500] [--workers 4] [--rate 2]
+"""
+from __future__ import annotations
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+import pandas as pd
+
+from . import llm
+from .data import get_df
+from .prompts import QUICK_PROMPTS, call_prompt
+
+logger = logging.getLogger("vita.pregenerate")
+
+class RateLimiter:
+    """
+    Limite di richieste al secondo condiviso tra i worker: ogni chiamata a
+    wait() prenota lo slot successivo e attende che arrivi.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+def top_clients(n: int) -> pd.DataFrame:
+    """Le prime `n` righe della vista nba_clienti per priority_score e valore_atteso_euro."""
+    df = get_df("nba_clienti")
+    return df.sort_values(
+        ["priority_score", "valore_atteso_euro"], ascending=False, na_position="last"
+    ).head(n)
+
+def pregenerate(
+    rows: pd.DataFrame,
+    workers: int = 4,
+    rate: float = 2.0,
+    ask: Callable[[str], str] | None = None,
+    progress: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Genera (con `ask`, che scrive in cache) le risposte rapide per ogni riga
+    non ancora in cache, con al massimo `workers` chiamate in parallelo e
+    `rate` chiamate al secondo. Una risposta "⚠️" o un'eccezione di `ask`
+    contano come errore senza fermare il batch. Restituisce i conteggi e il
+    throughput.
+    """
+    prompts = [call_prompt(row, question) for _, row in rows.iterrows() for question in QUICK_PROMPTS.values()]
+    # Ripresa dopo un'interruzione: si saltano i prompt che hanno già una risposta in cache
+    todo = [
+        prompt for prompt in prompts
+        if not llm.response_cache.contains(llm.cache_key(prompt))
+    ]
+
+    stats = {"totale": len(prompts), "saltati": len(prompts) - len(todo), "generati": 0, "errori": 0}
+    limiter = RateLimiter(rate)
+    ask = ask or llm.ask_llm
+
+    def job(prompt: str) -> bool:
+        limiter.wait()
+        return not ask(prompt).startswith("⚠️")
+
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(job, prompt) for prompt in todo]
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception:
+                # Un errore imprevisto su un prompt non deve annullare quelli in coda
+                logger.exception("Pre-generazione fallita")
+                ok = False
+            stats["generati" if ok else "errori"] += 1
+            if progress is not None:
+                progress(stats)
+    finally:
+        # Su Ctrl+C non si aspettano le richieste in coda: quelle completate sono già in cache
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    stats["secondi"] = time.perf_counter() - start
+    stats["al_secondo"] = stats["generati"] / stats["secondi"] if stats["secondi"] > 0 else 0.0
+    return stats
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=500, help="clienti prioritari da preparare")
+    parser.add_argument("--workers", type=int, default=4, help="chiamate in parallelo")
+    parser.add_argument("--rate", type=float, default=2.0, help="chiamate al secondo (0 = nessun limite)")
+    args = parser.parse_args()
+
+    if isinstance(llm.get_backend(), llm.OpenRouterBackend) and not llm.get_api_key():
+        raise SystemExit("OPENROUTER_API_KEY non configurata.")
+
+    rows = top_clients(args.top)
+    jobs = len(rows) * len(QUICK_PROMPTS)
+    if jobs > llm.CACHE_MAX_ENTRIES:
+        print(f"Attenzione: {jobs:,} risposte superano la capienza della cache ({llm.CACHE_MAX_ENTRIES:,}).")
+
+    last = [0.0]
+
+    def report(stats: dict) -> None:
+        now = time.monotonic()
+        if now - last[0] >= 5:
+            last[0] = now
+            done = stats["generati"] + stats["errori"]
+            print(f"{done:,}/{stats['totale'] - stats['saltati']:,} completate, {stats['errori']:,} errori")
+
+    stats = pregenerate(rows, workers=args.workers, rate=args.rate, progress=report)
+    print(
+        f"Risposte: {stats['totale']:,} · già in cache {stats['saltati']:,} · "
+        f"generate {stats['generati']:,} · errori {stats['errori']:,}"
+    )
+    print(f"Tempo {stats['secondi']:.1f} s · {stats['al_secondo']:.2f} risposte/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# tool/src/pricing.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+# Dimensioni su cui si impostano sconti e maggiorazioni
+RULE_DIMENSIONS = ["cluster_risposta", "cluster_stream1", "prodotto"]
+
+# Premi da cui può partire la simulazione
+BASES = {
+    "premio_totale_annuo": "Premio attuale",
+    "premio_simulato": "Premio proposto dall'AI",
+}
+
+class PricingSimulator:
+    """
+    Simulatore what-if sui premi. Ogni polizza ha la sua cella (combinazione
+    dei valori delle dimensioni delle regole) e ogni cella ha un solo fattore
+    di sconto o maggiorazione: i premi di tutte le polizze si ricalcolano con
+    un gather e un prodotto, e i totali di portafoglio dalle somme per cella
+    precalcolate, con un costo che non dipende dal numero di polizze.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: list[str] | None = None):
+        self.dimensions = list(dimensions or RULE_DIMENSIONS)
+        self.categories = {}
+        codes = []
+        for dim in self.dimensions:
+            cat = pd.Categorical(df[dim])
+            self.categories[dim] = list(cat.categories)
+            # Valore mancante: una posizione in più, senza regola (fattore 1)
+            codes.append(np.where(cat.codes < 0, len(cat.categories), cat.codes))
+        self.shape = tuple(len(self.categories[dim]) + 1 for dim in self.dimensions)
+        self.cells = np.ravel_multi_index(tuple(codes), self.shape).astype(np.intp)
+        size = int(np.prod(self.shape))
+
+        self.premiums = {col: df[col].to_numpy(dtype="float64", na_value=0.0) for col in BASES}
+        pure_premium = df["pure_premium_pred"].to_numpy(dtype="float64", na_value=0.0)
+
+        self.cell_count = np.bincount(self.cells, minlength=size)
+        self.cell_premiums = {
+            col: np.bincount(self.cells, weights=values, minlength=size) for col, values in self.premiums.items()
+        }
+        self.cell_cost = np.bincount(self.cells, weights=pure_premium, minlength=size)
+
+    def cell_factors(self, rules: dict) -> np.ndarray:
+        """
+        Fattore moltiplicativo per cella (array con una dimensione per regola).
+        `rules` mappa dimensione -> {valore: variazione}, con la variazione come
+        frazione (-0.1 = sconto del 10%); le regole di dimensioni diverse si
+        compongono.
+        """
+        unknown = set(rules) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Dimensioni senza regole di pricing: {sorted(unknown)}")
+
+        factors = np.ones(self.shape)
+        for axis, dim in enumerate(self.dimensions):
+            table = np.ones(self.shape[axis])
+            for value, change in rules.get(dim, {}).items():
+                if value not in self.categories[dim]:
+                    raise KeyError(f"[{dim}] Valore sconosciuto: {value}")
+                table[self.categories[dim].index(value)] = 1.0 + change
+            factors *= table.reshape([-1 if a == axis else 1 for a in range(len(self.shape))])
+        return factors
+
+    @timed("pricing.simulate")
+    def simulate(self, rules: dict, base: str = "premio_totale_annuo") -> np.ndarray:
+        """Premio simulato di ogni polizza, applicando le regole al premio `base`."""
+        if base not in self.premiums:
+            raise KeyError(f"Premio di partenza sconosciuto: {base}")
+        return self.premiums[base] * self.cell_factors(rules).ravel()[self.cells]
+
+    @timed("pricing.summary")
+    def summary(self, rules: dict, base: str = "premio_totale_annuo", by: str | None = None) -> pd.DataFrame:
+        """
+        Polizze, premi attuali e simulati, costo atteso dei sinistri e loss
+        ratio (costo / premi, NaN se i premi sono zero) per valore di `by`, o
+        dell'intero portafoglio. Calcolato sulle celle, senza passare dalle
+        singole polizze.
+        """
+        if base not in self.premiums:
+            raise KeyError(f"Premio di partenza sconosciuto: {base}")
+
+        simulated = self.cell_premiums[base] * self.cell_factors(rules).ravel()
+        if by is None:
+            axes, labels = tuple(range(len(self.shape))), ["Portafoglio"]
+        else:
+            keep = self.dimensions.index(by)
+            axes = tuple(a for a in range(len(self.shape)) if a != keep)
+            labels = self.categories[by] + ["n.d."]
+
+        def total(values: np.ndarray) -> np.ndarray:
+            return np.atleast_1d(values.reshape(self.shape).sum(axis=axes))
+
+        out = pd.DataFrame({
+            "polizze": total(self.cell_count),
+            "premi_attuali": total(self.cell_premiums["premio_totale_annuo"]),
+            "premi_simulati": total(simulated),
+            "costo_atteso": total(self.cell_cost),
+        }, index=pd.Index(labels, name=by or "totale"))
+        # Premi a zero (polizze gratuite, sconto del 100%): loss ratio non definito
+        out["loss_ratio_attuale"] = out["costo_atteso"] / out["premi_attuali"].where(out["premi_attuali"] > 0)
+        out["loss_ratio_simulato"] = out["costo_atteso"] / out["premi_simulati"].where(out["premi_simulati"] > 0)
+        return out[out["polizze"] > 0]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("pricing.build_simulator")
+def _build_simulator(name: str, version: tuple) -> PricingSimulator:
+    return PricingSimulator(get_df(name))
+
+def get_pricing_simulator(name: str) -> PricingSimulator:
+    """Simulatore di pricing di un dataset, preparato una volta per versione dei dati."""
+    return _build_simulator(name, dataset_version(name))
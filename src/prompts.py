@@ -0,0 +1,46 @@
+# tool/src/prompts.py
+from __future__ import annotations
+import pandas as pd
+
+# Azioni rapide della pagina "Chi contattare adesso": etichetta del bottone -> domanda
+QUICK_PROMPTS = {
+    "📞 Prepara la chiamata": (
+        "Preparami una sintesi operativa per la chiamata con questo cliente: "
+        "obiettivo, messaggio chiave e proposta da fare."
+    ),
+    "⚠️ Gestire il rischio": (
+        "Quali sono i principali rischi o criticità da considerare "
+        "durante la conversazione con questo cliente?"
+    ),
+}
+
+def call_prompt(row: pd.Series, question: str) -> str:
+    """
+    Prompt di Vita per preparare la chiamata con un cliente (una riga della
+    vista nba_clienti). È lo stesso testo per la pagina e per la
+    pre-generazione batch, così le risposte in cache coincidono.
+    """
+    return f"""
+Agisci come un consulente senior di una compagnia assicurativa.
+
+Il tuo obiettivo è supportare un collega nella preparazione di una chiamata con un cliente,
+utilizzando esclusivamente le informazioni fornite di seguito.
+
+PROFILO CLIENTE:
+- Azione consigliata: {row['next_best_action']}
+- Valore economico stimato: {row['valore_atteso_euro']:,.0f} €
+- Rischio di abbandono stimato: {row['churn_score_model']*100:.0f}%
+- Valore cliente (CLV): {row['clv_stimato']:,.0f} €
+- Livello di engagement: {row['engagement_score']:.1f}/100
+- Ultimo contatto: {row['mesi_da_ultima_visita']} mesi fa
+
+LINEE GUIDA:
+- Non ricalcolare né stimare nuovi dati
+- Spiegare in modo chiaro il perché dell’azione suggerita
+- Fornire indicazioni pratiche e concrete per una chiamata reale
+- Linguaggio professionale, semplice, orientato all’azione
+- Lunghezza massima: 8–10 righe
+
+DOMANDA:
+{question}
+"""
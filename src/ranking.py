@@ -0,0 +1,72 @@
+# tool/src/ranking.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+class RankIndex:
+    """
+    Classifiche precalcolate: per ogni punteggio l'ordine decrescente di
+    tutte le righe (stabile, NaN in fondo come sort_values) e il rango di
+    ogni riga. Un punteggio è una colonna o una tupla di colonne da sommare
+    (es. Casa + Salute). Un top-N su tutte le righe legge solo la testa
+    dell'ordine; su un sottoinsieme è un argpartition sui ranghi, senza
+    ordinare i valori.
+    """
+
+    def __init__(self, df: pd.DataFrame, scores: list[str | tuple], count_col: str = "n_clienti"):
+        self.count = df[count_col].to_numpy(dtype="float64", na_value=0.0)
+        self.order = {}
+        self.rank = {}
+        for score in scores:
+            if isinstance(score, tuple):
+                # Somma dei punteggi: un valore mancante conta zero
+                values = sum(np.nan_to_num(df[col].to_numpy(dtype="float64", na_value=np.nan)) for col in score)
+            else:
+                values = df[score].to_numpy(dtype="float64", na_value=np.nan)
+            keys = np.where(np.isnan(values), np.inf, -values)
+            order = np.argsort(keys, kind="stable")
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            self.order[score] = order
+            self.rank[score] = rank
+
+    @timed("ranking.top")
+    def top(self, score: str | tuple, n: int, min_clienti: float = 0, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        Posizioni delle prime `n` righe per `score` tra quelle con almeno
+        `min_clienti` clienti, dalla prima. `rows` limita la classifica a un
+        sottoinsieme di posizioni (None = tutte le righe).
+        """
+        if score not in self.order:
+            raise KeyError(f"Punteggio non presente nella classifica: {score}")
+
+        if rows is None:
+            # Si legge la testa dell'ordine, allargandola finché la soglia
+            # sui clienti lascia almeno n righe
+            order = self.order[score]
+            stop = max(4 * n, 64)
+            while True:
+                head = order[:stop]
+                head = head[self.count[head] >= min_clienti]
+                if len(head) >= n or stop >= len(order):
+                    return head[:n]
+                stop *= 4
+
+        rows = np.asarray(rows)
+        rows = rows[self.count[rows] >= min_clienti]
+        if len(rows) > n > 0:
+            rows = rows[np.argpartition(self.rank[score][rows], n - 1)[:n]]
+        return rows[np.argsort(self.rank[score][rows])][:n]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("ranking.build_index")
+def _build_index(name: str, version: tuple, scores: tuple) -> RankIndex:
+    return RankIndex(get_df(name), list(scores))
+
+def get_rank_index(name: str, scores: tuple) -> RankIndex:
+    """Classifiche di un dataset per i punteggi dati, calcolate una volta per versione dei dati."""
+    return _build_index(name, dataset_version(name), scores)
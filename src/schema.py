@@ -56,3 +56,84 @@ REQUIRED = {
         "pricing_action",
     ],
 }
+
+# Colonne non obbligatorie ma usate dalle pagine: lette solo se presenti nel file
+OPTIONAL = {
+    "clienti_clusterizzati.csv": [
+        "nome",
+        "cognome",
+        "num_polizze_totali",
+    ],
+    "potential_score_comuni.csv": [
+        "penetrazione_casa",
+        "penetrazione_salute",
+    ],
+    "nba_scores_clienti.csv": [],
+    "pricing_ai_output.csv": [],
+}
+
+# Tipi applicati in fase di parsing: categorie per le stringhe ripetute
+# (etichette, motivazioni NBA), float32 e interi piccoli per le metriche.
+DTYPES = {
+    "clienti_clusterizzati.csv": {
+        "codice_cliente": "Int32",
+        "cluster": "Int8",
+        "persona_label": "category",
+        "cluster_risposta": "category",
+        "engagement_score": "float32",
+        "satisfaction_score": "float32",
+        "reclami_totali": "Int8",
+        "clv_stimato": "float32",
+        "potenziale_crescita": "float32",
+        "luogo_di_residenza": "category",
+        "zona_di_residenza": "category",
+        "num_polizze_totali": "Int8",
+    },
+    "potential_score_comuni.csv": {
+        "n_clienti": "Int32",
+        "lat": "float32",
+        "lon": "float32",
+        "penetrazione_casa": "float32",
+        "penetrazione_salute": "float32",
+        "potential_score_casa": "float32",
+        "potential_score_salute": "float32",
+        "protection_gap_casa": "float32",
+        "protection_gap_salute": "float32",
+        "valore_immobiliare_medio": "float32",
+        "NDVI_mean": "float32",
+    },
+    "nba_scores_clienti.csv": {
+        "codice_cliente": "Int32",
+        "next_best_action": "category",
+        "priority_score": "float32",
+        "nba_reason": "category",
+        "churn_score_model": "float32",
+        "cross_sell_score": "float32",
+        "clv_stimato": "float32",
+        "potenziale_crescita": "float32",
+        "engagement_score": "float32",
+        "satisfaction_score": "float32",
+        "reclami_totali": "Int8",
+        "mesi_da_ultima_visita": "float32",
+        "multi_polizza_flag": "Int8",
+        "valore_atteso_euro": "float32",
+    },
+    "pricing_ai_output.csv": {
+        "codice_cliente": "Int32",
+        "prodotto": "category",
+        "premio_totale_annuo": "float32",
+        "premio_simulato": "float32",
+        "p_claim": "float32",
+        "severity_pred": "float32",
+        "pure_premium_pred": "float32",
+        "loss_ratio_pred": "float32",
+        "loss_ratio_post": "float32",
+        "cluster_stream1": "Int8",
+        "cluster_risposta": "category",
+        "pricing_action": "category",
+    },
+}
+
+def usecols(filename: str) -> list[str]:
+    """Colonne da leggere per un file: obbligatorie + opzionali usate dalle pagine."""
+    return REQUIRED.get(filename, []) + OPTIONAL.get(filename, [])
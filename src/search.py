@@ -0,0 +1,139 @@
+# tool/src/search.py
+from __future__ import annotations
+import re
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .data import dataset_version, get_df
+from .timing import timed
+
+# Candidati verificati al massimo per una ricerca con più termini
+MAX_CANDIDATES = 50_000
+
+# Separatore tra nome e ID in cliente_label (in minuscolo): non è una parola da cercare
+ID_SEPARATOR = " — id "
+
+def _normalize(text: str) -> str:
+    # Query normalizzata come le etichette nell'indice: un'etichetta incollata
+    # per intero nella casella ritrova il suo cliente
+    return f" {text.lower()} ".replace(ID_SEPARATOR, " ")
+
+class ClientSearchIndex:
+    """
+    Indice di ricerca sui clienti: ogni parola di cliente_label (nome,
+    cognome, ID) è una chiave in un array ordinato, e una ricerca per prefisso
+    è un paio di searchsorted (bisezione) invece di una scansione di tutti i
+    clienti. Se i prefissi non bastano, si cercano le sottostringhe sulle
+    parole distinte (molte meno dei clienti), non sulle etichette.
+    """
+
+    def __init__(self, df: pd.DataFrame, label_col: str = "cliente_label"):
+        self.labels = df[label_col].astype(object).to_numpy()
+
+        # Come _normalize, sulla colonna intera
+        tokens = (
+            (" " + pd.Series(self.labels, dtype="object").str.lower() + " ")
+            .str.replace(ID_SEPARATOR, " ", regex=False)
+            .str.split()
+            .explode()
+            .dropna()
+        )
+        keys = tokens.to_numpy(dtype=str)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = tokens.index.to_numpy()[order]
+
+        # Parole distinte e numero di righe di ognuna: keys è ordinato, ogni
+        # parola è un intervallo contiguo
+        starts = np.flatnonzero(self.keys[1:] != self.keys[:-1]) + 1
+        starts = np.r_[0, starts] if len(keys) else starts
+        self.word_counts = np.diff(np.r_[starts, len(keys)])
+        self.words = pd.Series(self.keys[starts], dtype="string[pyarrow]")
+
+    def _prefix_rows(self, term: str) -> np.ndarray:
+        # Nessuna chiave è più lunga del dtype dell'array: si evita anche che
+        # numpy allarghi (copiando) l'array per confrontarlo con la query
+        if len(term) > self.keys.dtype.itemsize // 4:
+            return self.rows[:0]
+        lo = np.searchsorted(self.keys, term, side="left")
+        hi = np.searchsorted(self.keys, term[:-1] + chr(ord(term[-1]) + 1), side="left")
+        return self.rows[lo:hi]
+
+    def _prefix_search(self, terms: list[str], limit: int) -> list:
+        # Si parte dal termine più selettivo (meno righe nel suo intervallo)
+        terms = sorted(terms, key=lambda t: len(self._prefix_rows(t)))
+        rows = pd.unique(self._prefix_rows(terms[0]))
+        if len(terms) == 1:
+            return rows[:limit].tolist()
+
+        # Gli altri termini si verificano sui candidati a blocchi, fermandosi
+        # appena ci sono abbastanza risultati. Per query fatte solo di iniziali
+        # la verifica si ferma a MAX_CANDIDATES: basta una lettera in più per restringere.
+        patterns = [r"(?:^|\s)" + re.escape(t) for t in terms[1:]]
+        found = []
+        for start in range(0, min(len(rows), MAX_CANDIDATES), 1024):
+            chunk = rows[start:start + 1024]
+            text = pd.Series(self.labels[chunk], dtype="object").str.lower()
+            ok = np.ones(len(chunk), dtype=bool)
+            for pattern in patterns:
+                ok &= text.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+            found.extend(chunk[ok])
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def _substring_search(self, terms: list[str], exclude: list, limit: int) -> list:
+        # Match sulle parole distinte, poi espansione alle righe di ogni parola:
+        # una maschera per cliente, in AND tra i termini
+        ok = np.ones(len(self.labels), dtype=bool)
+        for term in terms:
+            hit = self.words.str.contains(term, regex=False).to_numpy(dtype=bool, na_value=False)
+            matched = np.zeros(len(self.labels), dtype=bool)
+            matched[self.rows[np.repeat(hit, self.word_counts)]] = True
+            ok &= matched
+        ok[exclude] = False
+        return np.flatnonzero(ok)[:limit].tolist()
+
+    @timed("search.query")
+    def search(self, query: str, limit: int = 20) -> list[str]:
+        """
+        Etichette dei clienti in cui ogni parola della query è il prefisso di
+        una parola di nome, cognome o ID (prima le chiavi più corte, cioè i
+        match esatti); se non bastano, seguono quelle in cui ogni parola della
+        query è contenuta in una parola dell'etichetta.
+        """
+        terms = _normalize(query).split()
+        if not terms:
+            return []
+
+        found = self._prefix_search(terms, limit)
+        if len(found) < limit:
+            found += self._substring_search(terms, found, limit - len(found))
+        return self.labels[found].tolist()
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+@timed("search.build_index")
+def _build_index(name: str, version: tuple) -> ClientSearchIndex:
+    return ClientSearchIndex(get_df(name))
+
+def get_search_index(name: str) -> ClientSearchIndex:
+    """Indice di ricerca clienti di un dataset, costruito una volta per versione dei dati."""
+    return _build_index(name, dataset_version(name))
+
+def client_search_box(name: str, label: str, limit: int = 20) -> int | None:
+    """
+    Ricerca cliente nella sidebar: una casella di testo e una selectbox con i
+    soli primi risultati (non tutti i clienti). Restituisce il codice_cliente
+    selezionato, o None per "Tutti".
+    """
+    query = st.sidebar.text_input(
+        f"{label} — cerca",
+        placeholder="Nome, cognome o ID",
+    )
+    options = ["Tutti"] + get_search_index(name).search(query, limit=limit)
+
+    cliente_sel = st.sidebar.selectbox(label, options=options, index=0)
+    if cliente_sel == "Tutti":
+        return None
+    return int(cliente_sel.split("ID ")[-1])
@@ -0,0 +1,88 @@
+# tool/src/table.py
+from __future__ import annotations
+from math import ceil
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .timing import timed
+
+def _page_positions(df: pd.DataFrame, sort_by: str | None, ascending: bool, start: int, stop: int) -> np.ndarray:
+    # Solo le prime `stop` righe dell'ordinamento: argpartition + sort di quelle,
+    # invece di ordinare tutta la tabella
+    n = len(df)
+    stop = min(stop, n)
+    if sort_by is None:
+        return np.arange(start, stop)
+
+    values = df[sort_by].to_numpy(dtype="float64", na_value=np.nan)
+    keys = values if ascending else -values
+    keys = np.where(np.isnan(keys), np.inf, keys)  # NaN in fondo, come sort_values
+
+    if 0 < stop < n:
+        # Tutte le righe sopra la stop-esima chiave più quelle a pari merito
+        # con indice più basso: come un sort stabile, così pagine successive
+        # non duplicano né perdono righe con la stessa chiave sul bordo
+        kth = np.partition(keys, stop - 1)[stop - 1]
+        above = np.flatnonzero(keys < kth)
+        tied = np.flatnonzero(keys == kth)[:stop - len(above)]
+        top = np.sort(np.concatenate([above, tied]))
+    else:
+        top = np.arange(n)
+    top = top[np.argsort(keys[top], kind="stable")]
+    return top[start:stop]
+
+@timed("table.paged_table")
+def paged_table(
+    df: pd.DataFrame,
+    columns: dict[str, str],
+    formats: dict[str, str] | None = None,
+    sort_by: str | None = None,
+    ascending: bool = True,
+    limit: int | None = None,
+    page_size: int = 50,
+    transform: Callable[[pd.DataFrame], pd.DataFrame] | None = None,
+    key: str = "table",
+    height: int = 420,
+) -> None:
+    """
+    Tabella paginata lato server: al browser arriva solo la pagina visibile.
+
+    `columns` mappa colonna sorgente -> intestazione (nell'ordine di visualizzazione),
+    `formats` colonna sorgente -> formato printf applicato dal frontend tramite
+    column_config (niente Styler). `limit` tiene solo le prime N righe
+    dell'ordinamento; `transform` agisce solo sulle righe della pagina.
+    """
+    formats = formats or {}
+    total = len(df) if limit is None else min(limit, len(df))
+    pages = max(1, ceil(total / page_size))
+
+    page = 1
+    if pages > 1:
+        c1, c2 = st.columns([1, 4])
+        page = int(c1.number_input("Pagina", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page"))
+
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total)
+    if pages > 1:
+        c2.caption(f"Righe {start + 1:,}–{stop:,} di {total:,}")
+
+    view = df.iloc[_page_positions(df, sort_by, ascending, start, stop)][list(columns)]
+    if transform is not None:
+        view = transform(view)
+
+    column_config = {
+        col: st.column_config.NumberColumn(label, format=formats[col]) if col in formats
+        else st.column_config.Column(label)
+        for col, label in columns.items()
+    }
+
+    st.dataframe(
+        view.reset_index(drop=True),
+        column_config=column_config,
+        hide_index=True,
+        use_container_width=True,
+        height=height,
+    )
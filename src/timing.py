@@ -0,0 +1,128 @@
+# tool/src/timing.py
+from __future__ import annotations
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+# Attivazione: variabile d'ambiente VITA_TIMING=1 (tutte le sessioni)
+# oppure ?debug=1 nell'URL (solo quella sessione)
+ENV_FLAG = "VITA_TIMING"
+
+logger = logging.getLogger("vita.timing")
+
+# Ogni sessione Streamlit esegue lo script nel proprio thread:
+# i tempi del rerun corrente stanno in uno stato per thread
+_local = threading.local()
+
+class _Timer:
+    """Context manager e decoratore restituito da timed()."""
+
+    __slots__ = ("name", "_sections", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> _Timer:
+        self._sections = getattr(_local, "sections", None)
+        if self._sections is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self._sections is not None:
+            _record(self._sections, self.name, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, fn):
+        name = self.name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "sections", None) is None:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+def _record(sections: dict, name: str, elapsed: float) -> None:
+    entry = sections.get(name)
+    if entry is None:
+        sections[name] = [elapsed, 1]
+    else:
+        entry[0] += elapsed
+        entry[1] += 1
+
+def timed(name: str) -> _Timer:
+    """
+    Misura una sezione con nome: `with timed("data.load"):` oppure come
+    decoratore `@timed("llm.ask")`. I tempi si sommano per nome nel rerun
+    corrente. Con la misura spenta non registra nulla.
+    """
+    return _Timer(name)
+
+def _enable_log() -> None:
+    # Nessuno configura il logging dell'app: senza handler e livello propri
+    # le righe INFO di panel() andrebbero perse
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+def begin(page: str) -> None:
+    """
+    Inizio del rerun di una pagina: azzera i tempi e decide se misurare
+    (VITA_TIMING=1 o ?debug=1). Da chiamare in cima alla pagina.
+    """
+    enabled = os.getenv(ENV_FLAG) == "1" or st.query_params.get("debug") == "1"
+    if enabled:
+        _enable_log()
+    _local.sections = {} if enabled else None
+    _local.page = page
+    _local.start = _local.last = time.perf_counter()
+
+def lap(name: str) -> None:
+    """Attribuisce a `name` il tempo trascorso dall'ultimo lap (o da begin)."""
+    sections = getattr(_local, "sections", None)
+    if sections is None:
+        return
+    now = time.perf_counter()
+    _record(sections, f"page.{name}", now - _local.last)
+    _local.last = now
+
+def panel() -> None:
+    """
+    Fine del rerun: tempi per sezione nel pannello di debug della sidebar
+    e una riga di log JSON ("vita.timing"). Non fa nulla con la misura spenta.
+    """
+    sections = getattr(_local, "sections", None)
+    if sections is None:
+        return
+    total = time.perf_counter() - _local.start
+    _local.sections = None
+
+    logger.info(json.dumps({
+        "page": _local.page,
+        "total_ms": round(total * 1000, 2),
+        "sections": {name: {"ms": round(t * 1000, 2), "calls": n} for name, (t, n) in sections.items()},
+    }))
+
+    table = pd.DataFrame(
+        [(name, t * 1000, n) for name, (t, n) in sections.items()],
+        columns=["Sezione", "ms", "Chiamate"],
+    )
+    with st.sidebar.expander(f"⏱️ Rerun: {total * 1000:,.0f} ms", expanded=False):
+        st.caption("Le sezioni page.* sono in sequenza; quelle di src possono essere annidate.")
+        st.dataframe(
+            table,
+            column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+            hide_index=True,
+            use_container_width=True,
+        )
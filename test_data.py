@@ -0,0 +1,508 @@
+import os
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+from src import data
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    snapshots = tmp_path / ".snapshots"
+    monkeypatch.setattr(data, "SNAPSHOT_DIR", snapshots)
+    return snapshots
+
+
+def test_snapshot_is_written_and_invalidated(tmp_path, snapshot_dir):
+    path = tmp_path / "comuni.csv"
+    path.write_text("luogo_di_residenza,n_clienti\nroma,3\nmilano,5\n", encoding="utf-8")
+
+    df = data._read_dataset(path)
+    first = data._snapshot_path(path)
+    assert first.exists()
+    pd.testing.assert_frame_equal(data._read_dataset(path), df)
+
+    # Un nuovo export (mtime/dimensione diversi) invalida lo snapshot
+    path.write_text("luogo_di_residenza,n_clienti\nroma,4\n", encoding="utf-8")
+    os.utime(path, ns=(first.stat().st_mtime_ns + 10**9,) * 2)
+
+    assert data._read_dataset(path)["n_clienti"].tolist() == [4]
+    assert not first.exists()
+    assert list(snapshot_dir.glob("*.parquet")) == [data._snapshot_path(path)]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch, snapshot_dir):
+    monkeypatch.setattr(data, "DATA_DIR", tmp_path)
+    data.configure_pandas()
+    st.cache_resource.clear()
+    yield tmp_path
+    st.cache_resource.clear()
+
+
+def _write_comuni(data_dir, rows=(("roma", 3), ("milano", 5))):
+    lines = ["luogo_di_residenza,n_clienti,lat,lon,potential_score_casa,potential_score_salute,"
+             "protection_gap_casa,protection_gap_salute,valore_immobiliare_medio,NDVI_mean"]
+    lines += [f"{name},{n},41.9,12.5,0.5,0.4,1,0,250000,0.1" for name, n in rows]
+    (data_dir / "potential_score_comuni.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_get_df_loads_only_the_requested_file(data_dir):
+    _write_comuni(data_dir)
+
+    df = data.get_df("potential_score_comuni.csv")
+    assert df["n_clienti"].tolist() == [3, 5]
+
+    # Gli altri file mancano: falliscono solo le pagine che li chiedono
+    with pytest.raises(FileNotFoundError):
+        data.get_df("nba_scores_clienti.csv")
+    with pytest.raises(KeyError):
+        data.get_df("sconosciuto.csv")
+
+
+def test_schema_dtypes_and_usecols_applied_at_parse(data_dir):
+    _write_comuni(data_dir)
+    path = data_dir / "potential_score_comuni.csv"
+    path.write_text(path.read_text().replace("41.9", "n.d.", 1), encoding="utf-8")
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write("torino,2,45.1,7.7,0.2,0.1,0,1,180000,0.3\n")
+
+    df = data.get_df("potential_score_comuni.csv")
+    assert str(df["n_clienti"].dtype) == "Int32"
+    assert str(df["lat"].dtype) == "float32"
+    # Valore non numerico: conversione tollerante invece di un errore
+    assert df["lat"].isna().tolist() == [True, False, False]
+
+
+def test_views_share_a_read_only_base(data_dir):
+    _write_comuni(data_dir)
+
+    view = data.get_df("potential_score_comuni.csv")
+    view["n_clienti"] = 0
+    view["extra"] = 1
+
+    fresh = data.get_view("potential_score_comuni.csv", columns=["n_clienti"], doppio=lambda d: d["n_clienti"] * 2)
+    assert fresh["n_clienti"].tolist() == [3, 5]
+    assert fresh["doppio"].tolist() == [6, 10]
+    assert "extra" not in data.get_df("potential_score_comuni.csv").columns
+
+    with pytest.raises(ValueError):
+        data.get_df("potential_score_comuni.csv")["lat"].to_numpy()[0] = 0.0
+
+
+def _write_clienti(data_dir):
+    (data_dir / "clienti_clusterizzati.csv").write_text(
+        "codice_cliente,nome,cognome,cluster,persona_label,cluster_risposta,engagement_score,"
+        "satisfaction_score,reclami_totali,clv_stimato,potenziale_crescita,luogo_di_residenza,"
+        "zona_di_residenza,num_polizze_totali\n"
+        "1,mario,rossi,0,Famiglia,high_responder,50,60,0,1000,10,roma,Centro,2\n"
+        "2,anna,,1,Senior,non_responder,70,80,1,3000,20,milano,Nord,1\n"
+        "3,luca,verdi,0,Famiglia,low_responder,40,50,2,2000,30,roma,Centro,3\n",
+        encoding="utf-8",
+    )
+
+
+def test_extension_columns_are_read_only(data_dir):
+    _write_clienti(data_dir)
+    view = data.get_df("clienti_clusterizzati.csv")
+
+    # Categorie (codici) e interi nullable (valori e maschera)
+    with pytest.raises(ValueError):
+        view["persona_label"].array[0] = "Senior"
+    with pytest.raises(ValueError):
+        view["cluster"].array[0] = 5
+    with pytest.raises(ValueError):
+        view["codice_cliente"].array[0] = None
+
+    view.loc[0, "persona_label"] = "Senior"
+    fresh = data.get_df("clienti_clusterizzati.csv")
+    assert fresh["persona_label"].tolist() == ["Famiglia", "Senior", "Famiglia"]
+    assert fresh["codice_cliente"].tolist() == [1, 2, 3]
+
+
+def test_derived_columns_and_options_computed_once(data_dir):
+    _write_clienti(data_dir)
+
+    df = data.get_df("clienti_clusterizzati.csv")
+    assert df["cliente_label"].tolist() == ["Mario Rossi — ID 1", "Anna  — ID 2", "Luca Verdi — ID 3"]
+    assert df["probabilita_risposta"].astype(object).tolist()[::2] == ["Alta", "Bassa"]
+    assert pd.isna(df["probabilita_risposta"].iloc[1])
+
+    assert data.get_options("clienti_clusterizzati.csv", "zona_di_residenza") == ["Centro", "Nord"]
+    assert data.get_options("clienti_clusterizzati.csv", "probabilita_risposta") == ["Alta", "Bassa"]
+    with pytest.raises(KeyError):
+        data.get_options("clienti_clusterizzati.csv", "nome")
+
+
+def test_filter_index_matches_isin_filters(data_dir):
+    from src.filters import get_filter_index
+
+    _write_clienti(data_dir)
+    df = data.get_df("clienti_clusterizzati.csv")
+    index = get_filter_index("clienti_clusterizzati.csv", ["persona_label", "probabilita_risposta"])
+
+    # "Tutte": esclude solo le righe senza probabilità (non_responder)
+    assert index.mask(persona_label=None, probabilita_risposta=None).tolist() == [True, False, True]
+    assert df[index.mask(persona_label="Famiglia", probabilita_risposta="Bassa")]["codice_cliente"].tolist() == [3]
+    assert not index.mask(persona_label="Inesistente").any()
+
+
+def test_nba_view_is_joined_and_indexed_by_client(data_dir):
+    _write_clienti(data_dir)
+    (data_dir / "nba_scores_clienti.csv").write_text(
+        "codice_cliente,next_best_action,priority_score,nba_reason,churn_score_model,cross_sell_score,"
+        "clv_stimato,potenziale_crescita,engagement_score,satisfaction_score,reclami_totali,"
+        "mesi_da_ultima_visita,multi_polizza_flag,valore_atteso_euro\n"
+        "3,Retention,10,r,0.8,0.1,2000,30,40,50,2,3,0,500\n"
+        "9,Upsell,5,u,0.1,0.9,100,1,2,3,0,1,1,50\n"
+        "1,Upsell,7,u,0.2,0.7,1000,10,50,60,0,2,1,300\n",
+        encoding="utf-8",
+    )
+
+    view = data.get_df("nba_clienti")
+    assert view["cliente_label"].tolist() == ["Luca Verdi — ID 3", " — ID 9", "Mario Rossi — ID 1"]
+    assert data.get_client_rows("nba_clienti", 1)["valore_atteso_euro"].tolist() == [300]
+    assert data.get_client_rows("nba_clienti", 42).empty
+    assert data.get_options("nba_clienti", "next_best_action") == ["Retention", "Upsell"]
+
+
+def test_cube_matches_groupby(data_dir):
+    from src.cube import get_cube
+
+    _write_clienti(data_dir)
+    df = data.get_df("clienti_clusterizzati.csv")
+    metrics = ["clv_stimato", "engagement_score", "reclami_totali"]
+    cube = get_cube("clienti_clusterizzati.csv", ["persona_label", "probabilita_risposta"], metrics)
+
+    # Il non_responder (senza probabilità) resta fuori come nei filtri della pagina
+    expected = df[df["probabilita_risposta"].notna()].groupby("persona_label", observed=True)[metrics]
+    by_persona = cube.aggregate(by="persona_label")
+    assert by_persona.index.tolist() == ["Famiglia"]
+    assert by_persona[metrics].to_numpy().tolist() == expected.mean().to_numpy(dtype="float64").tolist()
+    assert by_persona["n_clienti"].tolist() == [2]
+
+    kpi = cube.aggregate(probabilita_risposta="Alta")
+    assert kpi["n_clienti"] == 1 and kpi["clv_stimato"] == 1000
+    assert cube.aggregate(stat="sum")["clv_stimato"] == 3000
+    assert cube.aggregate(persona_label="Senior")["n_clienti"] == 0
+
+
+def test_ingest_detects_encoding_and_repairs_mojibake(tmp_path, snapshot_dir):
+    latin = tmp_path / "latin.csv"
+    latin.write_bytes("luogo_di_residenza,n_clienti\nforlì,1\n".encode("latin1"))
+    assert data._read_csv_safely(latin)["luogo_di_residenza"].tolist() == ["forlì"]
+
+    # Testo UTF-8 già passato una volta da latin1: "Ã\xa0" -> "à"
+    broken = tmp_path / "potential_score_comuni.csv"
+    broken.write_text(
+        "luogo_di_residenza,n_clienti\nsant'agata,1\ncittà di castello,2\nforlì,3\n"
+        .replace("à", "à".encode("utf-8").decode("latin1")),
+        encoding="utf-8",
+    )
+    df = data._read_csv_safely(broken)
+    assert df["luogo_di_residenza"].tolist() == ["sant'agata", "città di castello", "forlì"]
+
+    nba = tmp_path / "nba_scores_clienti.csv"
+    nba.write_text("codice_cliente,nba_reason\n1,Priorità alta\n2,Priorità alta\n3,Ok\n".replace("à", "Ã\xa0"), encoding="utf-8")
+    reasons = data._read_csv_safely(nba)["nba_reason"]
+    assert str(reasons.dtype) == "category"
+    assert reasons.tolist() == ["Priorità alta", "Priorità alta", "Ok"]
+
+
+def test_client_search_index_prefix_and_substring_matches(data_dir):
+    from src.search import get_search_index
+
+    _write_clienti(data_dir)
+    index = get_search_index("clienti_clusterizzati.csv")
+
+    assert index.search("ross") == ["Mario Rossi — ID 1"]
+    assert index.search("l v") == ["Luca Verdi — ID 3"]
+    assert index.search("2") == ["Anna  — ID 2"]
+    assert index.search("  ") == []
+    assert len(index.search("a", limit=1)) == 1
+
+    # Sottostringhe dopo i prefissi
+    assert index.search("ari") == ["Mario Rossi — ID 1"]
+    assert index.search("ss ar") == ["Mario Rossi — ID 1"]
+    assert index.search("a") == ["Anna  — ID 2", "Mario Rossi — ID 1", "Luca Verdi — ID 3"]
+    assert index.search("xyz") == []
+
+    # Un'etichetta incollata per intero ritrova il suo cliente
+    assert index.search("Mario Rossi — ID 1") == ["Mario Rossi — ID 1"]
+    assert index.search("— ID 3") == ["Luca Verdi — ID 3"]
+
+
+def test_paged_table_positions_match_sort_values():
+    import numpy as np
+    from src.table import _page_positions
+
+    df = pd.DataFrame({"v": [3.0, np.nan, 7.0, 1.0, 7.0, 5.0, np.nan, 2.0]})
+    expected = df.sort_values("v", ascending=False, kind="stable").index.to_numpy()
+
+    for start, stop in [(0, 3), (3, 6), (6, 8), (0, 8), (5, 50)]:
+        got = _page_positions(df, "v", False, start, stop)
+        assert got.tolist() == expected[start:stop].tolist()
+    assert _page_positions(df, None, True, 2, 4).tolist() == [2, 3]
+
+    # Molte chiavi uguali a cavallo del bordo di pagina (valori interi)
+    rng = np.random.default_rng(0)
+    ties = pd.DataFrame({"v": rng.integers(0, 4, 500).astype(float)})
+    ties.loc[::37, "v"] = np.nan
+    for ascending in (True, False):
+        expected = ties.sort_values("v", ascending=ascending, kind="stable").index.to_numpy()
+        pages = [_page_positions(ties, "v", ascending, s, s + 50) for s in range(0, 500, 50)]
+        for i, page in enumerate(pages):
+            assert page.tolist() == expected[i * 50:(i + 1) * 50].tolist()
+        assert sorted(np.concatenate(pages).tolist()) == list(range(500))
+
+
+def test_synthetic_data_is_consistent_across_files(data_dir):
+    from benchmarks.synthetic_data import generate
+
+    rows = generate(2_000, data_dir, seed=1)
+    assert rows["clienti_clusterizzati.csv"] == rows["nba_scores_clienti.csv"] == 2_000
+
+    frames = data.load_all()
+    clienti = frames["clienti_clusterizzati.csv"]
+    comuni = frames["potential_score_comuni.csv"]
+    pricing = frames["pricing_ai_output.csv"]
+
+    assert clienti["codice_cliente"].is_unique
+    assert set(pricing["codice_cliente"]) <= set(clienti["codice_cliente"])
+    assert set(clienti["luogo_di_residenza"]) <= set(comuni["luogo_di_residenza"])
+    assert comuni["n_clienti"].sum() == len(clienti)
+    assert not data.get_df("nba_clienti")["cliente_label"].str.startswith(" — ").any()
+
+
+def test_synthetic_data_follows_the_schema(tmp_path, monkeypatch):
+    from benchmarks.synthetic_data import generate
+    from src import schema
+
+    # Oltre le 8.000 combinazioni di sillabe i nomi restano unici
+    rows = generate(200, tmp_path, seed=2, n_comuni=8_500)
+    assert rows["potential_score_comuni.csv"] == 8_500
+    comuni = pd.read_csv(tmp_path / "potential_score_comuni.csv")
+    assert comuni["luogo_di_residenza"].is_unique
+
+    for filename in schema.REQUIRED:
+        header = pd.read_csv(tmp_path / filename, nrows=0).columns.tolist()
+        assert header == schema.usecols(filename)
+
+    # Una colonna aggiunta o tolta dallo schema rompe il generatore
+    pricing = schema.REQUIRED["pricing_ai_output.csv"]
+    monkeypatch.setitem(schema.REQUIRED, "pricing_ai_output.csv", pricing + ["nuova_colonna"])
+    with pytest.raises(ValueError, match="nuova_colonna"):
+        generate(200, tmp_path, seed=2)
+    monkeypatch.setitem(schema.REQUIRED, "pricing_ai_output.csv", pricing[:-1])
+    with pytest.raises(ValueError, match=pricing[-1]):
+        generate(200, tmp_path, seed=2)
+
+
+def test_timing_sums_sections_only_when_enabled(monkeypatch, caplog):
+    import json
+    import logging
+    from src import timing
+
+    @timing.timed("work")
+    def work():
+        return 42
+
+    monkeypatch.delenv(timing.ENV_FLAG, raising=False)
+    timing.begin("pagina")
+    assert work() == 42
+    assert timing._local.sections is None
+
+    monkeypatch.setenv(timing.ENV_FLAG, "1")
+    timing.begin("pagina")
+    work()
+    with timing.timed("work"):
+        pass
+    timing.lap("sezione")
+    sections = timing._local.sections
+    assert sections["work"][1] == 2
+    assert sections["page.sezione"][0] >= sections["work"][0]
+    timing.panel()
+    assert timing._local.sections is None
+    records = [r for r in caplog.records if r.name == "vita.timing"]
+    assert len(records) == 1
+    assert records[0].levelno == logging.INFO
+    assert json.loads(records[0].getMessage())["page"] == "pagina"
+
+
+def test_spatial_grid_index_matches_brute_force_haversine():
+    import numpy as np
+    from src.geo import SpatialGridIndex, haversine_km
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(37.0, 46.0, 5_000)
+    lon = rng.uniform(7.0, 18.0, 5_000)
+    lat[10] = np.nan
+    index = SpatialGridIndex(lat, lon, cell_deg=0.2)
+
+    assert haversine_km(45.4642, 9.19, 41.9028, 12.4964) == pytest.approx(477, abs=2)
+    for radius in (0, 3, 40, 250):
+        positions, dist = index.within(42.0, 12.5, radius)
+        expected = np.flatnonzero(haversine_km(42.0, 12.5, lat, lon) <= radius)
+        assert sorted(positions.tolist()) == expected.tolist()
+        assert np.all(np.diff(dist) >= 0)
+    assert len(index.within(0.0, 0.0, 100)[0]) == 0
+
+
+def test_geo_bins_keep_totals_at_every_level():
+    import numpy as np
+    from src.geo import BIN_LEVELS, GeoBins
+
+    df = pd.DataFrame({
+        "lat": [41.1, 41.2, 41.9, 45.3, np.nan, 41.6],
+        "lon": [12.1, 12.3, 12.9, 9.2, 10.0, 12.6],
+        "n_clienti": [1, 3, 2, 4, 5, 10],
+        "score": [1.0, 0.0, 0.5, 0.2, 0.9, np.nan],
+    })
+    bins = GeoBins(df, ["score"])
+
+    for level in BIN_LEVELS:
+        cells = bins.cells(level)
+        assert cells["n_comuni"].sum() == 5
+        assert cells["n_clienti"].sum() == 20
+    assert len(bins.cells("Ampio")) == 2
+    # Il comune senza punteggio non pesa sulla media della sua cella
+    assert bins.cells("Ampio")["score"].tolist() == pytest.approx([2.0 / 6, 0.2])
+    dettaglio = bins.cells("Dettaglio")
+    assert dettaglio.loc[dettaglio["lat_min"] == 41.5, "score"].isna().all()
+    with pytest.raises(KeyError):
+        bins.cells("Quartiere")
+
+
+def test_chart_specs_are_built_once_per_version_and_key(data_dir):
+    import altair as alt
+    from src.charts import cached_chart
+
+    _write_comuni(data_dir)
+    builds, drawn = [], []
+
+    class Container:
+        def vega_lite_chart(self, spec, **kwargs):
+            drawn.append(spec)
+
+    def build():
+        builds.append(1)
+        bars = alt.Chart(data.get_df("potential_score_comuni.csv")).mark_bar().encode(
+            x="n_clienti:Q", y="luogo_di_residenza:N"
+        )
+        return bars + alt.Chart(pd.DataFrame({"x": [4]})).mark_rule().encode(x="x:Q")
+
+    def no_transformer(data, **kwargs):
+        raise AssertionError("trasformatore globale di Altair usato")
+
+    # Lo spec non passa dal trasformatore né dal tema globali di Altair
+    alt.data_transformers.register("test_no_transformer", no_transformer)
+    with alt.data_transformers.enable("test_no_transformer"):
+        for key in [("Casa",), ("Casa",), ("Salute",), ("Casa",)]:
+            cached_chart("potential_score_comuni.csv", "test.bar", key, build, Container())
+    assert len(builds) == 2
+    assert drawn[0] is drawn[1]
+    assert drawn[2] is not drawn[0]
+
+    # Dati in Arrow dentro lo spec, un dataset per sottografico, senza tema
+    spec = drawn[0]
+    names = [layer["data"]["name"] for layer in spec["layer"]]
+    assert sorted(names) == sorted(spec["datasets"])
+    assert all(isinstance(payload, bytes) for payload in spec["datasets"].values())
+    assert "config" not in spec
+
+    # Nuovo export dei dati: nuova versione, spec ricostruito
+    _write_comuni(data_dir, rows=(("roma", 3), ("milano", 5), ("torino", 7)))
+    os.utime(data_dir / "potential_score_comuni.csv", ns=(1, 1))
+    cached_chart("potential_score_comuni.csv", "test.bar", ("Casa",), build, Container())
+    assert len(builds) == 3
+
+
+def test_rank_index_top_matches_filtered_sort():
+    import numpy as np
+    from src.ranking import RankIndex
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "n_clienti": rng.integers(0, 10, 2_000),
+        "casa": rng.random(2_000).round(2),
+        "salute": rng.random(2_000),
+    })
+    df.loc[[3, 7], "casa"] = np.nan
+    mix = ("casa", "salute")
+    index = RankIndex(df, ["casa", mix])
+    totals = {"casa": df["casa"], mix: df["casa"].fillna(0) + df["salute"]}
+
+    subset = rng.choice(len(df), 300, replace=False)
+    for score, values in totals.items():
+        ranked = df.assign(v=values).sort_values("v", ascending=False, kind="stable")
+        expected = ranked[ranked["n_clienti"] >= 5].index
+        assert index.top(score, 10, min_clienti=5).tolist() == expected[:10].tolist()
+        assert index.top(score, 30, min_clienti=5, rows=subset).tolist() == [
+            i for i in expected if i in set(subset)
+        ][:30]
+    assert len(index.top("casa", 10, min_clienti=100)) == 0
+    with pytest.raises(KeyError):
+        index.top("salute", 10)
+
+
+def test_pricing_simulator_matches_row_by_row_rules():
+    import numpy as np
+    from src.pricing import PricingSimulator
+
+    rng = np.random.default_rng(0)
+    n = 1_000
+    df = pd.DataFrame({
+        "cluster_risposta": rng.choice(["high_responder", "low_responder", None], n),
+        "cluster_stream1": rng.integers(0, 4, n),
+        "prodotto": rng.choice(["casa", "salute"], n),
+        "premio_totale_annuo": rng.uniform(100, 900, n),
+        "premio_simulato": rng.uniform(100, 900, n),
+        "pure_premium_pred": rng.uniform(0, 500, n),
+    })
+    sim = PricingSimulator(df)
+    rules = {"cluster_risposta": {"high_responder": -0.1}, "cluster_stream1": {2: 0.05}, "prodotto": {"salute": 0.2}}
+
+    factor = (
+        np.where(df["cluster_risposta"] == "high_responder", 0.9, 1.0)
+        * np.where(df["cluster_stream1"] == 2, 1.05, 1.0)
+        * np.where(df["prodotto"] == "salute", 1.2, 1.0)
+    )
+    expected = df["premio_simulato"] * factor
+    assert np.allclose(sim.simulate(rules, base="premio_simulato"), expected)
+
+    total = sim.summary(rules, base="premio_simulato").iloc[0]
+    assert total["polizze"] == n
+    assert total["premi_simulati"] == pytest.approx(expected.sum())
+    assert total["loss_ratio_attuale"] == pytest.approx(df["pure_premium_pred"].sum() / df["premio_totale_annuo"].sum())
+
+    by_product = sim.summary(rules, base="premio_simulato", by="prodotto")
+    assert by_product["premi_simulati"].to_dict() == pytest.approx(expected.groupby(df["prodotto"]).sum().to_dict())
+    assert by_product["polizze"].sum() == n
+    with pytest.raises(KeyError):
+        sim.simulate({"prodotto": {"vita": 0.1}})
+
+
+def test_pricing_loss_ratio_is_nan_for_zero_premiums():
+    import numpy as np
+    from src.pricing import PricingSimulator
+
+    df = pd.DataFrame({
+        "cluster_risposta": ["high_responder", "low_responder", "low_responder"],
+        "cluster_stream1": [0, 1, 1],
+        "prodotto": ["casa", "salute", "salute"],
+        "premio_totale_annuo": [0.0, 400.0, 600.0],
+        "premio_simulato": [0.0, 400.0, 600.0],
+        "pure_premium_pred": [50.0, 100.0, 100.0],
+    })
+    sim = PricingSimulator(df)
+
+    by_product = sim.summary({}, by="prodotto")
+    assert np.isnan(by_product.loc["casa", "loss_ratio_attuale"])
+    assert by_product.loc["salute", "loss_ratio_attuale"] == pytest.approx(0.2)
+    assert np.isfinite(sim.summary({}).iloc[0]["loss_ratio_attuale"])
+
+    # Sconto del 100%: premi simulati a zero, loss ratio non definito
+    free = sim.summary({"prodotto": {"salute": -1.0}}, by="prodotto")
+    assert free["loss_ratio_simulato"].isna().all()
+    assert not np.isinf(free[["loss_ratio_attuale", "loss_ratio_simulato"]].to_numpy()).any()
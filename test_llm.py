@@ -1,3 +1,474 @@
-from src.llm import ask_llm
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-print(ask_llm("Rispondi solo con OK"))
+import pytest
+import requests
+
+from src import llm
+
+
+class _StubSSEHandler(BaseHTTPRequestHandler):
+    # Risponde come OpenRouter in modalità stream: un evento SSE per token
+    tokens = ["Ciao", ", ", "sono ", "Vita"]
+    delay_s = 0.05
+    status = 200
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+
+        if self.status != 200:
+            self.send_response(self.status)
+            self.end_headers()
+            self.wfile.write(b"rate limited")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        for token in self.tokens:
+            time.sleep(self.delay_s)
+            event = {"choices": [{"delta": {"content": token}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = llm.ResponseCache(tmp_path / "responses.sqlite3")
+    monkeypatch.setattr(llm, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def stub_server(monkeypatch, cache):
+    monkeypatch.setattr(llm, "get_api_key", lambda: "test-key")
+    monkeypatch.setattr(llm, "BACKOFF_BASE_S", 0.01)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubSSEHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(llm, "_backend", llm.OpenRouterBackend(url=_url(server)))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+
+
+def test_ask_llm_stream_yields_tokens_and_timings(stub_server):
+    stats = {}
+    chunks = list(llm.ask_llm_stream("Rispondi solo con OK", stats=stats))
+
+    assert chunks == _StubSSEHandler.tokens
+    assert stub_server.requests[0]["stream"] is True
+    assert stub_server.requests[0]["messages"][-1]["content"] == "Rispondi solo con OK"
+
+    assert stats["chunks"] == 4
+    # Il primo token arriva dopo un solo ritardo, lo stream completo dopo tutti
+    assert 0.04 <= stats["ttft_s"] < stats["total_s"]
+    assert stats["total_s"] >= 4 * _StubSSEHandler.delay_s
+
+
+def test_ask_llm_stream_reports_http_errors(stub_server, monkeypatch):
+    monkeypatch.setattr(_StubSSEHandler, "status", 429)
+    stats = {}
+    chunks = list(llm.ask_llm_stream("x", stats=stats))
+
+    assert chunks == ["⚠️ Errore AI: rate limited"]
+    assert len(stub_server.requests) == llm.MAX_RETRIES + 1
+    assert stats["ttft_s"] is None
+    assert stats["total_s"] is not None
+
+
+def test_stream_is_served_from_cache_on_repeat(stub_server, cache):
+    first = "".join(llm.ask_llm_stream("Prepara la chiamata"))
+
+    stats = {}
+    # Stesso prompt a meno di spazi e a capo: stessa chiave
+    second = list(llm.ask_llm_stream("  Prepara \n la   chiamata ", stats=stats))
+
+    assert second == [first]
+    assert stats["cached"] is True
+    assert len(stub_server.requests) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_errors_are_not_cached(stub_server, cache, monkeypatch):
+    monkeypatch.setattr(_StubSSEHandler, "status", 400)
+    list(llm.ask_llm_stream("x"))
+    list(llm.ask_llm_stream("x"))
+
+    assert len(stub_server.requests) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_response_cache_ttl_and_lru(tmp_path, monkeypatch):
+    cache = llm.ResponseCache(tmp_path / "c.sqlite3", ttl_s=60, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(llm.time, "time", lambda: now[0])
+
+    cache.put("a", "A")
+    now[0] += 1
+    cache.put("b", "B")
+    now[0] += 1
+    assert cache.get("a") == "A"  # "a" ora è la più recente
+    now[0] += 1
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_response_cache_closes_its_connections(tmp_path, monkeypatch):
+    import sqlite3
+
+    cache = llm.ResponseCache(tmp_path / "c.sqlite3")
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(llm.sqlite3, "connect", tracking_connect)
+    for i in range(200):
+        cache.put(f"k{i}", "risposta")
+        assert cache.get(f"k{i}") == "risposta"
+        assert cache.contains(f"k{i}")
+    cache.stats()
+
+    # Una connessione per operazione e nessuna rimasta aperta
+    assert len(opened) == 601
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    # Risposte JSON non in streaming con keep-alive; `failures` sono gli status
+    # da restituire (in ordine) prima di rispondere correttamente
+    protocol_version = "HTTP/1.1"
+    failures: list = []
+    latency_s = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.clients.append(self.client_address)
+        time.sleep(self.latency_s)
+
+        status = self.server.failures.pop(0) if self.server.failures else 200
+        if status == "not-json":
+            # 200 con un corpo che non è JSON (es. pagina HTML di un proxy)
+            payload = b"<html>Bad gateway</html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if status == "drop":
+            # Richiesta ricevuta, connessione chiusa senza risposta
+            self.close_connection = True
+            return
+        body = {"choices": [{"message": {"content": "OK"}}]} if status == 200 else {"error": status}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server(monkeypatch, cache):
+    monkeypatch.setattr(llm, "get_api_key", lambda: "test-key")
+    monkeypatch.setattr(llm, "BACKOFF_BASE_S", 0.01)
+    # Sessione nuova per ogni test: il pool non deve puntare a server già chiusi
+    monkeypatch.setattr(llm, "_session", None)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyHandler)
+    server.clients = []
+    server.failures = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(llm, "_backend", llm.OpenRouterBackend(url=_url(server)))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_ask_llm_retries_transient_errors_on_one_connection(flaky_server):
+    flaky_server.failures = [503, 429]
+    answer = llm.ask_llm("ciao", cache=False)
+
+    assert answer == "OK"
+    assert len(flaky_server.clients) == 3
+    # Keep-alive: i tentativi e le chiamate successive riusano la stessa connessione
+    llm.ask_llm("ancora", cache=False)
+    assert len(set(flaky_server.clients)) == 1
+
+
+def test_ask_llm_gives_up_after_max_retries(flaky_server):
+    flaky_server.failures = [503] * 10
+    answer = llm.ask_llm("ciao", cache=False)
+
+    assert answer.startswith("⚠️ Errore AI")
+    assert len(flaky_server.clients) == llm.MAX_RETRIES + 1
+
+
+@pytest.mark.parametrize("status", [400, 500, 502, 504])
+def test_ask_llm_does_not_retry_errors_after_processing(flaky_server, status):
+    # Il server potrebbe aver già generato la risposta: non si rimanda la POST
+    flaky_server.failures = [status]
+    answer = llm.ask_llm("ciao", cache=False)
+
+    assert answer.startswith("⚠️ Errore AI")
+    assert len(flaky_server.clients) == 1
+
+
+def test_read_timeout_is_separate_and_not_retried(flaky_server, monkeypatch):
+    monkeypatch.setattr(_FlakyHandler, "latency_s", 0.3)
+    monkeypatch.setattr(llm, "READ_TIMEOUT_S", 0.1)
+    answer = llm.ask_llm("ciao", cache=False)
+
+    # La richiesta era già partita: nessun secondo invio
+    assert answer.startswith("⚠️ Errore di connessione AI")
+    assert len(flaky_server.clients) == 1
+
+
+def test_dropped_connection_after_send_is_not_retried(flaky_server):
+    flaky_server.failures = ["drop"]
+    answer = llm.ask_llm("ciao", cache=False)
+
+    assert answer.startswith("⚠️ Errore di connessione AI")
+    assert len(flaky_server.clients) == 1
+
+
+def test_non_json_success_body_is_an_error(flaky_server, cache):
+    flaky_server.failures = ["not-json"]
+    answer = llm.ask_llm("ciao")
+
+    assert answer.startswith("⚠️ Risposta AI non valida")
+    assert cache.stats()["entries"] == 0
+
+
+def test_refused_connections_are_retried(monkeypatch):
+    # Porta libera senza nessuno in ascolto: NewConnectionError a ogni tentativo
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    sleeps = []
+    monkeypatch.setattr(llm, "_session", None)
+    monkeypatch.setattr(llm.time, "sleep", sleeps.append)
+    with pytest.raises(requests.ConnectionError):
+        llm._post(f"http://127.0.0.1:{port}/")
+    assert len(sleeps) == llm.MAX_RETRIES
+
+
+def test_connect_errors_are_retried(monkeypatch):
+    class _Session:
+        calls = 0
+
+        def post(self, *args, **kwargs):
+            self.calls += 1
+            raise requests.ConnectTimeout("connessione non aperta")
+
+    session = _Session()
+    monkeypatch.setattr(llm, "_get_session", lambda: session)
+    monkeypatch.setattr(llm, "BACKOFF_BASE_S", 0.01)
+    with pytest.raises(requests.ConnectTimeout):
+        llm._post("http://127.0.0.1:9/")
+    assert session.calls == llm.MAX_RETRIES + 1
+
+
+def test_backoff_is_bounded_and_honours_retry_after():
+    delays = [llm._backoff_s(attempt) for attempt in range(20) for _ in range(5)]
+    assert all(0 <= d <= llm.BACKOFF_MAX_S for d in delays)
+
+    response = requests.Response()
+    response.headers["Retry-After"] = "2"
+    assert llm._backoff_s(0, response) == 2.0
+    response.headers["Retry-After"] = "3600"
+    assert llm._backoff_s(0, response) == llm.BACKOFF_MAX_S
+
+
+def test_pregenerate_fills_cache_and_resumes(flaky_server, cache):
+    import pandas as pd
+    from src.pregenerate import pregenerate
+    from src.prompts import QUICK_PROMPTS, call_prompt
+
+    rows = pd.DataFrame({
+        "next_best_action": ["Retention", "Cross-sell", "Upsell"],
+        "valore_atteso_euro": [3000.0, 2000.0, 1000.0],
+        "churn_score_model": [0.8, 0.2, 0.1],
+        "clv_stimato": [30000.0, 20000.0, 10000.0],
+        "engagement_score": [50.0, 60.0, 70.0],
+        "mesi_da_ultima_visita": [3.0, 6.0, 9.0],
+    })
+
+    # Un errore non ritentabile: quella risposta resta da generare
+    flaky_server.failures = [400]
+    first = pregenerate(rows, workers=2, rate=0)
+    assert first["generati"] == 5 and first["errori"] == 1 and first["saltati"] == 0
+
+    second = pregenerate(rows, workers=2, rate=0)
+    assert second["generati"] == 1 and second["saltati"] == 5
+    assert len(flaky_server.clients) == 7
+
+    # La pagina costruisce lo stesso prompt e trova la risposta in cache
+    stats = {}
+    prompt = call_prompt(rows.iloc[0], next(iter(QUICK_PROMPTS.values())))
+    assert list(llm.ask_llm_stream(prompt, stats=stats)) == ["OK"]
+    assert stats["cached"] is True
+
+
+def test_pregenerate_counts_exceptions_and_keeps_going(cache):
+    import pandas as pd
+    from src.pregenerate import pregenerate
+
+    rows = pd.DataFrame({
+        "next_best_action": ["Retention", "Cross-sell"],
+        "valore_atteso_euro": [3000.0, 2000.0],
+        "churn_score_model": [0.8, 0.2],
+        "clv_stimato": [30000.0, 20000.0],
+        "engagement_score": [50.0, 60.0],
+        "mesi_da_ultima_visita": [3.0, 6.0],
+    })
+    calls = []
+
+    def ask(prompt: str) -> str:
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise ValueError("risposta illeggibile")
+        return "OK"
+
+    stats = pregenerate(rows, workers=1, rate=0, ask=ask)
+    assert stats["errori"] == 1
+    assert stats["generati"] == stats["totale"] - 1 == len(calls) - 1
+
+
+def test_rate_limiter_spaces_calls():
+    from src.pregenerate import RateLimiter
+
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 5 / 50 - 0.005
+
+
+def test_conversation_window_summary_and_cap():
+    from src.conversation import Conversation, estimate_tokens
+
+    conv = Conversation(token_budget=100, summary_budget=60, max_turns=6)
+    for i in range(10):
+        conv.add("user", f"Domanda {i}. " + "x" * 120)
+        conv.add("assistant", f"Risposta {i}. " + "y" * 120)
+
+    # In memoria restano solo gli ultimi max_turns turni
+    assert len(conv.turns) == 6 and conv.summarized == 14
+    assert conv.turns[-1][1].startswith("Risposta 9")
+
+    context = conv.context()
+    summary, window = context[0], context[1:]
+    assert summary["role"] == "system"
+    assert estimate_tokens(summary["content"]) <= 60 + estimate_tokens("Riassunto della conversazione precedente:\n")
+    assert sum(estimate_tokens(m["content"]) for m in window) <= 100
+    assert [m["content"][:10] for m in window] == ["Domanda 9.", "Risposta 9"]
+    # I turni fuori dalla finestra ma ancora in memoria finiscono nel riassunto
+    assert "Risposta 8." in summary["content"]
+
+    conv.reset()
+    assert conv.context() == []
+
+
+def test_history_is_sent_and_keys_the_cache(stub_server):
+    history = [{"role": "user", "content": "Chi è?"}, {"role": "assistant", "content": "Un cliente."}]
+    list(llm.ask_llm_stream("E quindi?"))
+    list(llm.ask_llm_stream("E quindi?", history=history))
+
+    assert len(stub_server.requests) == 2
+    messages = stub_server.requests[1]["messages"]
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1:3] == history
+
+
+def test_failed_replies_are_kept_out_of_the_conversation(stub_server, monkeypatch):
+    from src.conversation import Conversation
+
+    conv = Conversation()
+    stats = {}
+    answer = "".join(llm.ask_llm_stream("Chi è?", stats=stats))
+    conv.add_exchange("Chi è?", answer, failed=stats["error"] is not None)
+    assert stats["error"] is None
+
+    monkeypatch.setattr(_StubSSEHandler, "status", 429)
+    answer = "".join(llm.ask_llm_stream("E quindi?", stats=stats))
+    assert answer.startswith("⚠️ Errore AI") and stats["error"] is not None
+    conv.add_exchange("E quindi?", answer, failed=stats["error"] is not None)
+
+    # Né la domanda senza risposta né l'errore tornano al modello come storia
+    assert conv.context() == [
+        {"role": "user", "content": "Chi è?"},
+        {"role": "assistant", "content": "Ciao, sono Vita"},
+    ]
+
+
+def test_backend_must_implement_complete_and_stream():
+    class OnlyComplete(llm.LLMBackend):
+        model, temperature = "solo-complete", 0.0
+
+        def complete(self, messages):
+            return "OK"
+
+    with pytest.raises(TypeError):
+        OnlyComplete()
+    assert isinstance(llm.MockBackend(), llm.LLMBackend)
+
+
+def test_mock_backend_is_deterministic_and_streams(cache):
+    backend = llm.MockBackend(first_token_s=0.05, token_s=0.001, words=10)
+    stats = {}
+    chunks = list(llm.ask_llm_stream("Prepara la chiamata", stats=stats, backend=backend, cache=False))
+
+    assert len(chunks) == 11
+    assert "".join(chunks) == llm.ask_llm("Prepara la chiamata", backend=backend, cache=False)
+    assert "".join(chunks) != llm.ask_llm("Altra domanda", backend=backend, cache=False)
+    assert 0.05 <= stats["ttft_s"] < stats["total_s"]
+
+
+def test_mock_backend_errors_are_reproducible(cache):
+    def outcomes():
+        backend = llm.MockBackend(first_token_s=0, token_s=0, error_rate=0.3, seed=7, words=1)
+        return [llm.ask_llm(f"q{i}", backend=backend).startswith("⚠️") for i in range(50)]
+
+    first = outcomes()
+    assert 5 <= sum(first) <= 25
+    cache.path.unlink()
+    assert outcomes() == first
+
+
+if __name__ == "__main__":
+    # Prova manuale contro OpenRouter (serve OPENROUTER_API_KEY)
+    from src.llm import ask_llm
+
+    print(ask_llm("Rispondi solo con OK"))